@@ -0,0 +1,104 @@
+"""Piece images, fonts and text for drawing the board, loaded on first use and kept.
+The twelve piece images are read once and packed side by side into one atlas surface converted for
+fast blitting. For each square size a scaled atlas is made and every piece is a subsurface of it, so
+the window can change size without reading the files again and going back to a size costs nothing.
+Fonts and rendered text are cached as well: looking up a SysFont takes milliseconds, far too long to
+do every frame.
+The display mode has to be set before the first image is asked for, convert_alpha needs it.
+"""
+
+import os
+from collections import OrderedDict
+import pygame as p
+
+PIECES = ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")
+_here = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIRS = (os.path.join(_here, "chess_images"), _here) #searched in this order for the piece images
+TEXT_CACHE_SIZE = 64 #rendered strings kept, the least recently used is dropped first
+
+_atlas = None #every piece at the size of its file, side by side in the order of PIECES
+_cell = 0 #width of a piece in _atlas
+_scaled = {} #(square size, smooth) -> {piece: subsurface of the atlas scaled to that size}
+_fonts = {} #(name, size, bold, italic) -> Font
+_texts = OrderedDict() #(text, font key, color, antialias) -> rendered Surface
+
+
+def image_path(piece):
+    """Path of the image file of piece, such as "wK" """
+    for directory in IMAGE_DIRS:
+        path = os.path.join(directory, piece + ".png")
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError("No image for %s in %s" % (piece, ", ".join(IMAGE_DIRS)))
+
+
+def atlas():
+    """(atlas surface, cell width), loading the piece images into it the first time"""
+    global _atlas, _cell
+    if _atlas is None:
+        #converted one by one first, copying between the byte orders of the files and the display is slow
+        images = [p.image.load(image_path(piece)).convert_alpha() for piece in PIECES]
+        _cell = max(max(image.get_size()) for image in images)
+        _atlas = p.Surface((_cell * len(PIECES), _cell), p.SRCALPHA).convert_alpha()
+        for i, image in enumerate(images):
+            #copied rather than blended, blending onto the transparent atlas would darken the antialiased edges
+            _atlas.blit(image, (i * _cell + (_cell - image.get_width()) // 2, (_cell - image.get_height()) // 2),
+                        special_flags=p.BLEND_RGBA_MAX)
+    return _atlas, _cell
+
+
+def piece_images(square_size, smooth=False):
+    """{piece: image} square_size pixels wide, scaled from the atlas once for each size.
+    smooth filters the pixels as they are scaled, which looks better on small boards but is slower"""
+    images = _scaled.get((square_size, smooth))
+    if images is None:
+        scale = p.transform.smoothscale if smooth else p.transform.scale
+        source, cell = atlas()
+        scaled = p.Surface((square_size * len(PIECES), square_size), p.SRCALPHA).convert_alpha()
+        images = {}
+        for i, piece in enumerate(PIECES):
+            #each piece is scaled on its own so its neighbours in the atlas do not bleed into its edges
+            images[piece] = scaled.subsurface(p.Rect(i * square_size, 0, square_size, square_size))
+            scale(source.subsurface(p.Rect(i * cell, 0, cell, cell)), (square_size, square_size), images[piece])
+        _scaled[(square_size, smooth)] = images
+    return images
+
+
+def piece_image(piece):
+    """The image of piece at the size of its file"""
+    source, cell = atlas()
+    return source.subsurface(p.Rect(PIECES.index(piece) * cell, 0, cell, cell))
+
+
+def font(name, size, bold=False, italic=False):
+    key = (name, size, bold, italic)
+    cached = _fonts.get(key)
+    if cached is None:
+        if not p.font.get_init():
+            p.font.init()
+        cached = _fonts[key] = p.font.SysFont(name, size, bold, italic)
+    return cached
+
+
+def text(string, name, size, color, bold=False, italic=False, antialias=False):
+    """string rendered in color, a color name or tuple, with the font font(name, size, bold, italic).
+    The surface is shared with later calls for the same text, so do not draw on it"""
+    key = (string, name, size, bold, italic, color, antialias)
+    surface = _texts.get(key)
+    if surface is None:
+        surface = font(name, size, bold, italic).render(string, antialias, p.Color(color))
+        _texts[key] = surface
+        if len(_texts) > TEXT_CACHE_SIZE:
+            _texts.popitem(last=False)
+    else:
+        _texts.move_to_end(key)
+    return surface
+
+
+def clear():
+    """Forget every image, font and text, so the next ones are loaded from scratch"""
+    global _atlas
+    _atlas = None
+    _scaled.clear()
+    _fonts.clear()
+    _texts.clear()
@@ -0,0 +1,123 @@
+"""Legal move generation and engine searches run in a worker process, so a window never waits on them.
+Every job carries the whole game, the FEN it started from and the move_IDs played, so the worker can
+rebuild it with its history for repetitions, and results come back on a queue as move_IDs.
+Jobs are tagged with the generation they were asked for in. Moving on to a new position (a move,
+an undo, a new game) starts a new generation: the worker skips jobs left over from an old one, a
+search still running for one stops at its next budget check, and poll drops any result that
+comes back for one.
+"""
+
+import multiprocessing
+import queue
+import Chess_Engine
+import Chess_Search
+import Chess_Transposition
+
+
+class _Superseded():
+    '''
+    Stands in for the stop Event of a Searcher: set once the game has moved past generation
+    '''
+    def __init__(self, current, generation):
+        self.current = current
+        self.generation = generation
+
+    def is_set(self):
+        return self.current.value != self.generation
+
+
+def _worker(backend, move_cache_size, tt_mb, jobs, results, current):
+    gs = backend()
+    gs.move_cache = Chess_Engine.MoveCache(move_cache_size)
+    searcher = Chess_Search.Searcher(Chess_Transposition.TranspositionTable(tt_mb))
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        kind, generation, start_fen, move_IDs, time_limit = job
+        if generation != current.value: #asked for a position the game has already left
+            continue
+        try:
+            gs.load_fen(start_fen)
+            for move_ID in move_IDs:
+                gs.make_move(Chess_Engine.Move.from_move_ID(move_ID, gs.board))
+            if kind == "moves":
+                moves = gs.get_valid_moves()
+                results.put(("moves", generation, [move.move_ID for move in moves], gs.check_mate, gs.stale_mate,
+                             gs.get_draw_reason()))
+            else:
+                searcher.stop_event = _Superseded(current, generation)
+                result = searcher.search(gs, time_limit=time_limit)
+                if result is None:
+                    results.put(("search", generation, None, None))
+                else:
+                    results.put(("search", generation, result.best_move.move_ID, str(result)))
+        except Exception as error: #reported rather than killing the worker and leaving the job unanswered
+            results.put(("error", generation, "%s job failed: %s" % (kind, str(error) or repr(error))))
+
+
+class BackgroundWorker():
+    def __init__(self, backend=Chess_Engine.GameState, move_cache_size=4096, tt_mb=Chess_Search.DEFAULT_TT_MB):
+        context = multiprocessing.get_context()
+        self.generation = 0
+        self.pending = 0 #jobs of this generation whose results have not been polled yet
+        self._current = context.RawValue('l', 0) #the generation, shared with the worker
+        self._jobs = context.Queue()
+        self._results = context.Queue()
+        self.process = context.Process(target=_worker, daemon=True,
+                                       args=(backend, move_cache_size, tt_mb, self._jobs, self._results, self._current))
+        self.process.start()
+
+    '''
+    Start a new generation: every job asked for so far is cancelled and its results will be dropped
+    '''
+    def new_generation(self):
+        self.generation += 1
+        self._current.value = self.generation
+        self.pending = 0
+
+    '''
+    Ask for the legal moves of the game that started from start_fen and went on with move_IDs. The result
+    is ("moves", generation, move_IDs of the legal moves, check_mate, stale_mate, draw reason or None)
+    '''
+    def request_moves(self, start_fen, move_IDs):
+        self._jobs.put(("moves", self.generation, start_fen, list(move_IDs), None))
+        self.pending += 1
+
+    '''
+    Ask for the engine's move in the game that started from start_fen and went on with move_IDs, searched
+    for time_limit seconds. The result is ("search", generation, move_ID, SearchResult as text), with
+    None for both when there is no legal move
+    '''
+    def request_search(self, start_fen, move_IDs, time_limit):
+        self._jobs.put(("search", self.generation, start_fen, list(move_IDs), time_limit))
+        self.pending += 1
+
+    '''
+    Results of the current generation that have arrived since the last poll. Never waits.
+    A job that failed comes back as ("error", generation, message), and so does every job still
+    pending when the worker process has stopped; the worker cannot be used after that
+    '''
+    def poll(self):
+        fresh = []
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if result[1] == self.generation:
+                fresh.append(result)
+                self.pending -= 1
+        if self.pending and not self.process.is_alive():
+            fresh.append(("error", self.generation, "Background worker stopped with exit code %s"
+                          % self.process.exitcode))
+            self.pending = 0
+        return fresh
+
+    def close(self):
+        self.new_generation() #stops a search that is running
+        self._jobs.put(None)
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
@@ -0,0 +1,196 @@
+"""Batch analysis of many positions or games on every core.
+Inputs are read lazily and sent in chunks to a ProcessPoolExecutor. Each worker process keeps one
+GameState and one Searcher for everything it is given, so only FEN strings, PGN games and small
+result objects cross between processes. Results come back in input order, or as soon as each
+chunk is done with ordered=False.
+Run directly: python Chess_Batch.py (--fens FILE | --pgn FILE) [--workers N] [--depth N] [--time S]
+              [--chunk N] [--unordered] [--bitboard]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import Chess_Engine
+import Chess_Bitboard
+import Chess_Search
+import Chess_Transposition
+import Chess_PGN
+
+DEFAULT_CHUNK = 16 #items per task, enough to make the cost of sending a task small next to the work
+PENDING_CHUNKS_PER_WORKER = 2 #chunks queued ahead for each worker, bounds how much input is read early
+WORKER_TT_MB = 4
+
+#Set in every worker process by _init_worker
+_gs = None
+_searcher = None
+_search_options = None
+
+
+class PositionAnalysis():
+    def __init__(self, fen, best_move=None, score=None, depth=0, nodes=0, error=None):
+        self.fen = fen
+        self.best_move = best_move #coordinate notation, None when there are no legal moves or on error
+        self.score = score #centipawns for the side to move
+        self.depth = depth
+        self.nodes = nodes
+        self.error = error #message if the position could not be analysed
+
+    def __str__(self):
+        if self.error is not None:
+            return "%s error %s" % (self.fen, self.error)
+        return "%s best %s score %s depth %d nodes %d" % (self.fen, self.best_move, self.score, self.depth, self.nodes)
+
+
+class GameAnalysis():
+    def __init__(self, headers, played, positions, error=None):
+        self.headers = headers
+        self.played = played #SAN of the moves played
+        self.positions = positions #a PositionAnalysis of the position before every move played
+        self.error = error
+
+    def __str__(self):
+        title = "%s - %s %s" % (self.headers.get("White", "?"), self.headers.get("Black", "?"),
+                                self.headers.get("Result", "*"))
+        if self.error is not None:
+            return "%s error %s" % (title, self.error)
+        lines = [title]
+        for number, (san, position) in enumerate(zip(self.played, self.positions)):
+            lines.append("  %3d %-8s best %s score %s" % (number + 1, san, position.best_move, position.score))
+        return "\n".join(lines)
+
+
+def _init_worker(backend, depth, time_limit, tt_mb):
+    global _gs, _searcher, _search_options
+    _gs = backend()
+    _searcher = Chess_Search.Searcher(Chess_Transposition.TranspositionTable(tt_mb))
+    _search_options = {"max_depth": depth, "time_limit": time_limit}
+
+
+def error_text(error):
+    """What went wrong with one item, for its result. Workers catch any exception per item, so a bad
+    position or game is reported in its own result instead of ending the whole batch"""
+    return str(error) or repr(error)
+
+
+def _analyse_current():
+    """PositionAnalysis of the worker's GameState as it stands"""
+    fen = _gs.to_fen()
+    result = _searcher.search(_gs, **_search_options)
+    if result is None: #mate or stalemate, the search leaves check_mate as it found it
+        _gs.get_valid_moves()
+        return PositionAnalysis(fen, score=-Chess_Search.CHECKMATE if _gs.check_mate else Chess_Search.STALEMATE)
+    return PositionAnalysis(fen, result.best_move.get_chess_notation(), result.score, result.depth, result.nodes)
+
+
+def analyse_fen(fen):
+    """Analyse one FEN in the worker process"""
+    try:
+        _gs.load_fen(fen)
+        return _analyse_current()
+    except Exception as error:
+        return PositionAnalysis(fen, error=error_text(error))
+
+
+def analyse_game(game):
+    """Analyse the position before every move of a PGNGame in the worker process"""
+    positions = []
+    try:
+        _gs.load_fen(game.start_fen())
+        for san in game.moves:
+            positions.append(_analyse_current())
+            _gs.make_move(Chess_PGN.parse_san(_gs, san))
+    except Exception as error:
+        return GameAnalysis(game.headers, game.moves, positions, error_text(error))
+    return GameAnalysis(game.headers, game.moves, positions)
+
+
+def _run_chunk(function, items):
+    return [function(item) for item in items]
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def map_chunks(executor, workers, function, items, chunk_size=DEFAULT_CHUNK, ordered=True):
+    """Yield function(item) for every item, run by executor in chunks of chunk_size items.
+    Only PENDING_CHUNKS_PER_WORKER chunks for each of the workers are read ahead of the results,
+    so items can be a generator over a file of any size"""
+    chunks = _chunks(items, chunk_size)
+    max_pending = workers * PENDING_CHUNKS_PER_WORKER
+    pending = [] #futures in submission order
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < max_pending:
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+            else:
+                pending.append(executor.submit(_run_chunk, function, chunk))
+        if not pending:
+            return
+        if ordered:
+            future = pending.pop(0)
+        else:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            future = done.pop()
+            pending.remove(future)
+        yield from future.result()
+
+
+def analyse(items, function=analyse_fen, workers=None, chunk_size=DEFAULT_CHUNK, ordered=True, depth=4,
+            time_limit=None, backend=Chess_Engine.GameState, tt_mb=WORKER_TT_MB):
+    """Yield function(item) for every item, worked out by a pool of worker processes.
+    function is analyse_fen for FEN strings or analyse_game for PGNGames. items may be any iterable,
+    including a generator over a file: only a few chunks per worker are read ahead of the results.
+    With ordered=False results come back as soon as their chunk is finished"""
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(backend, depth, time_limit, tt_mb)) as executor:
+        yield from map_chunks(executor, workers, function, items, chunk_size, ordered)
+
+
+def read_fens(lines):
+    """FENs from lines, skipping blank lines and # comments"""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse many positions or games on every core")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--fens", help="file with one FEN per line")
+    source.add_argument("--pgn", help="PGN file of games to review")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, default one per core")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--time", type=float, default=None, help="seconds per position")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="items sent to a worker at once")
+    parser.add_argument("--unordered", action="store_true", help="print results as soon as they are ready")
+    parser.add_argument("--bitboard", action="store_true", help="use the bitboard backend")
+    args = parser.parse_args()
+    backend = Chess_Bitboard.BitboardGameState if args.bitboard else Chess_Engine.GameState
+    start = time.perf_counter()
+    count = 0
+    with open(args.fens or args.pgn, encoding="utf-8", errors="replace") as input_file:
+        if args.fens:
+            items, function = read_fens(input_file), analyse_fen
+        else:
+            items, function = Chess_PGN.read_games(input_file), analyse_game
+        for result in analyse(items, function, args.workers, args.chunk, not args.unordered, args.depth,
+                              args.time, backend):
+            print(result)
+            count += 1
+    seconds = time.perf_counter() - start
+    print("%d analysed in %.2fs, %.1f/s" % (count, seconds, count / seconds if seconds > 0 else 0.0),
+          file=sys.stderr)
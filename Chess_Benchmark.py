@@ -0,0 +1,417 @@
+"""Benchmarks for the move generation in Chess_Engine.
+Run directly: python Chess_Benchmark.py
+"""
+
+import io
+import os
+import random
+import time
+import tracemalloc
+import Chess_Engine
+import Chess_Bitboard
+import Chess_Perft
+import Chess_Search
+import Chess_Transposition
+import Chess_Evaluation
+import Chess_PGN
+import Chess_Batch
+import Chess_SMP
+
+#Positions reached by replaying coordinate moves from the start position
+POSITIONS = {
+    "start": "",
+    "italian": "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5 c2c3 g8f6 d2d3 d7d6 e1g1 e8g8 b1d2 a7a6",
+    "queens gambit": "d2d4 d7d5 c2c4 e7e6 b1c3 g8f6 c1g5 f8e7 e2e3 e8g8 g1f3 b8d7 a1c1 c7c6 f1d3 d5c4 d3c4",
+    "open middlegame": "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6 c1e3 e7e5 d4b3 c8e6 f2f3 f8e7 d1d2 e8g8",
+}
+
+
+class ReferenceGameState(Chess_Engine.GameState):
+    """GameState using the original attack detection: generate every opponent move
+    and look for one that lands on the square"""
+    def square_under_attack(self, r, c):
+        self.whiteToMove = not self.whiteToMove
+        opponent_moves = self.get_all_possible_moves()
+        self.whiteToMove = not self.whiteToMove
+        for move in opponent_moves:
+            if move.end_row == r and move.end_col == c:
+                return True
+        return False
+
+
+def play_moves(gs, moves):
+    """Play space separated coordinate moves (e.g. 'e2e4 e7e5') on gs"""
+    for notation in moves.split():
+        for move in gs.get_valid_moves():
+            if move.get_chess_notation() == notation:
+                gs.make_move(move)
+                break
+        else:
+            raise ValueError("Illegal move " + notation)
+    return gs
+
+
+def time_valid_moves(gs, repeats):
+    """Seconds per get_valid_moves call on gs"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        gs.get_valid_moves()
+    return (time.perf_counter() - start) / repeats
+
+
+def bench_attack_detection(repeats=200):
+    """Compare legal move generation using direct attack detection with the reference
+    implementation, checking both produce the same moves"""
+    print("%-18s %6s %12s %12s %8s" % ("position", "moves", "reference", "direct", "speedup"))
+    for name, moves in POSITIONS.items():
+        gs = play_moves(Chess_Engine.GameState(), moves)
+        ref = play_moves(ReferenceGameState(), moves)
+        #attack detection dominates when every pseudo legal move is filtered by make/undo
+        gs.reference_move_generation = ref.reference_move_generation = True
+        direct_moves = [m.get_chess_notation() for m in gs.get_valid_moves()]
+        ref_moves = [m.get_chess_notation() for m in ref.get_valid_moves()]
+        if direct_moves != ref_moves:
+            raise AssertionError("Move lists differ in position " + name)
+        ref_time = time_valid_moves(ref, max(1, repeats // 10))
+        direct_time = time_valid_moves(gs, repeats)
+        print("%-18s %6d %10.3fms %10.3fms %7.1fx" % (name, len(direct_moves), ref_time * 1000,
+                                                        direct_time * 1000, ref_time / direct_time))
+
+
+def bench_legal_generator(repeats=200):
+    """Compare the pins and checks legal move generator with make/undo filtering of
+    pseudo legal moves, checking both produce the same moves"""
+    print("%-18s %6s %12s %12s %8s" % ("position", "moves", "filtering", "pins", "speedup"))
+    for name, moves in POSITIONS.items():
+        gs = play_moves(Chess_Engine.GameState(), moves)
+        legal_moves = [m.get_chess_notation() for m in gs.get_valid_moves()]
+        gs.reference_move_generation = True
+        filtered_moves = [m.get_chess_notation() for m in gs.get_valid_moves()]
+        if sorted(legal_moves) != sorted(filtered_moves):
+            raise AssertionError("Move lists differ in position " + name)
+        filter_time = time_valid_moves(gs, repeats)
+        gs.reference_move_generation = False
+        legal_time = time_valid_moves(gs, repeats)
+        print("%-18s %6d %10.3fms %10.3fms %7.1fx" % (name, len(legal_moves), filter_time * 1000,
+                                                        legal_time * 1000, filter_time / legal_time))
+
+
+def check_backends_agree(games=20, max_plies=150, seed=1):
+    """Play random games on the list and bitboard backends side by side and check they
+    generate the same legal moves and flag the same mates in every position"""
+    rng = random.Random(seed)
+    positions = 0
+    for _ in range(games):
+        list_gs = Chess_Engine.GameState()
+        bitboard_gs = Chess_Bitboard.BitboardGameState()
+        for _ in range(max_plies):
+            list_moves = {m.get_chess_notation(): m for m in list_gs.get_valid_moves()}
+            bitboard_moves = {m.get_chess_notation(): m for m in bitboard_gs.get_valid_moves()}
+            if list_moves.keys() != bitboard_moves.keys() or list_gs.check_mate != bitboard_gs.check_mate or \
+                    list_gs.stale_mate != bitboard_gs.stale_mate:
+                raise AssertionError("Backends disagree after " + " ".join(
+                    m.get_chess_notation() for m in list_gs.movelog))
+            positions += 1
+            if not list_moves:
+                break
+            notation = rng.choice(sorted(list_moves))
+            list_gs.make_move(list_moves[notation])
+            bitboard_gs.make_move(bitboard_moves[notation])
+        while bitboard_gs.movelog: #undoing everything must restore the starting bitboards
+            bitboard_gs.undoMove()
+        if bitboard_gs.bitboards != Chess_Bitboard.BitboardGameState().bitboards:
+            raise AssertionError("Bitboards not restored by undoMove")
+    return positions
+
+
+def bench_bitboard_backend(depth=3):
+    """Nodes per second of the list and bitboard backends counting leaf nodes to depth"""
+    print("backends agree in %d positions" % check_backends_agree())
+    print("%-18s %9s %12s %12s" % ("position", "nodes", "list nps", "bitboard nps"))
+    for name, moves in POSITIONS.items():
+        results = []
+        for backend in (Chess_Engine.GameState, Chess_Bitboard.BitboardGameState):
+            gs = play_moves(backend(), moves)
+            start = time.perf_counter()
+            nodes = Chess_Perft.perft(gs, depth)
+            results.append((nodes, nodes / (time.perf_counter() - start)))
+        print("%-18s %9d %12.0f %12.0f" % (name, results[0][0], results[0][1], results[1][1]))
+
+
+def bench_move_size(count=10000, depth=3):
+    """Memory allocated per Move and move generation throughput"""
+    gs = Chess_Engine.GameState()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    moves = [Chess_Engine.Move((6, 4), (4, 4), gs.board) for _ in range(count)]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print("%.1f bytes per Move (including its list slot)" % (allocated / len(moves)))
+    start = time.perf_counter()
+    for _ in range(count):
+        Chess_Engine.Move((6, 4), (4, 4), gs.board)
+    print("%.3f us per Move" % ((time.perf_counter() - start) / count * 1e6))
+    gs = Chess_Perft.load_fen(Chess_Perft.SUITE[1][1])
+    nodes, seconds, nps = Chess_Perft.timed_perft(gs, depth)
+    print("kiwipete perft %d: %d nodes, %.0f nps" % (depth, nodes, nps))
+
+
+def bench_tt_sizes(sizes_mb=(1, 4, 16, 64), depth=5):
+    """Search a middlegame to a fixed depth with different transposition table sizes"""
+    print("%6s %9s %8s %s" % ("MB", "nodes", "seconds", "table"))
+    for size_mb in sizes_mb:
+        gs = play_moves(Chess_Engine.GameState(), POSITIONS["italian"])
+        tt = Chess_Transposition.TranspositionTable(size_mb)
+        result = Chess_Search.Searcher(tt).search(gs, max_depth=depth)
+        print("%6d %9d %8.2f %s" % (size_mb, result.nodes, result.seconds, tt.stats()))
+
+
+def bench_move_ordering(depth=4):
+    """Nodes and time to search each position to a fixed depth with and without move ordering"""
+    print("%-18s %12s %12s %8s %8s" % ("position", "unordered", "ordered", "ratio", "speedup"))
+    for name, moves in POSITIONS.items():
+        results = []
+        for use_ordering in (False, True):
+            gs = play_moves(Chess_Engine.GameState(), moves)
+            results.append(Chess_Search.Searcher(use_ordering=use_ordering).search(gs, max_depth=depth))
+        print("%-18s %12d %12d %7.2fx %7.2fx" % (name, results[0].nodes, results[1].nodes,
+                                                 results[0].nodes / results[1].nodes,
+                                                 results[0].seconds / results[1].seconds))
+
+
+def bench_quiescence(depth=4):
+    """Share of the search spent in the quiescence search at a fixed depth"""
+    print("%-18s %10s %10s %8s %8s %7s" % ("position", "nodes", "qnodes", "share", "seconds", "score"))
+    for name, moves in POSITIONS.items():
+        gs = play_moves(Chess_Engine.GameState(), moves)
+        result = Chess_Search.Searcher().search(gs, max_depth=depth)
+        print("%-18s %10d %10d %7.1f%% %8.2f %7d" % (name, result.nodes, result.qnodes,
+                                                    result.qnodes * 100 / result.nodes, result.seconds,
+                                                    result.score))
+
+
+def random_fens(count, max_plies=80, seed=1):
+    """FENs of positions from random games, for loading benchmarks"""
+    rng = random.Random(seed)
+    gs = Chess_Engine.GameState()
+    fens = []
+    while len(fens) < count:
+        gs.load_fen(Chess_Perft.START_FEN)
+        for _ in range(max_plies):
+            moves = gs.get_valid_moves()
+            if not moves or len(fens) == count:
+                break
+            gs.make_move(rng.choice(moves))
+            fens.append(gs.to_fen())
+    return fens
+
+
+def bench_fen_loading(count=20000):
+    """FENs per second read into one reused GameState and into a new one each time,
+    checking to_fen gives every FEN back unchanged"""
+    fens = random_fens(count)
+    gs = Chess_Engine.GameState()
+    start = time.perf_counter()
+    for fen in fens:
+        gs.load_fen(fen)
+    reused = time.perf_counter() - start
+    start = time.perf_counter()
+    for fen in fens:
+        Chess_Engine.GameState.from_fen(fen)
+    fresh = time.perf_counter() - start
+    for fen in fens:
+        gs.load_fen(fen)
+        if gs.to_fen() != fen:
+            raise AssertionError("FEN changed by a round trip: %s -> %s" % (fen, gs.to_fen()))
+    print("%d FENs: reused GameState %.0f/s, new GameState %.0f/s, round trip ok" % (
+        count, count / reused, count / fresh))
+
+
+def bench_pgn(games=200, max_plies=120, seed=1):
+    """Games per second written as PGN and read back by parsing and replaying the SAN,
+    checking every game ends in the same position"""
+    rng = random.Random(seed)
+    played = []
+    for _ in range(games):
+        gs = Chess_Engine.GameState()
+        for _ in range(max_plies):
+            moves = gs.get_valid_moves()
+            if not moves:
+                break
+            gs.make_move(rng.choice(moves))
+        played.append(gs)
+    stream = io.StringIO()
+    start = time.perf_counter()
+    for gs in played:
+        Chess_PGN.write_game(stream, gs)
+    written = time.perf_counter() - start
+    stream.seek(0)
+    start = time.perf_counter()
+    plies = 0
+    for number, (game, gs) in enumerate(Chess_PGN.replay_games(stream)):
+        if gs.to_fen() != played[number].to_fen():
+            raise AssertionError("PGN game %d replayed to %s instead of %s" % (
+                number + 1, gs.to_fen(), played[number].to_fen()))
+        plies += len(game.moves)
+    read = time.perf_counter() - start
+    print("%d games, %d plies: written %.0f games/s, read and replayed %.0f games/s (%.0f plies/s)" % (
+        games, plies, games / written, games / read, plies / read))
+
+
+def bench_batch(count=64, depth=2, worker_counts=(1, 2, 4), chunk_sizes=(1, 16)):
+    """Positions per second analysed by Chess_Batch for each number of workers and chunk size,
+    checking every position comes back once and in order"""
+    fens = random_fens(count, seed=2)
+    print("%8s %6s %12s" % ("workers", "chunk", "positions/s"))
+    for workers in worker_counts:
+        for chunk_size in chunk_sizes:
+            start = time.perf_counter()
+            results = list(Chess_Batch.analyse(fens, workers=workers, chunk_size=chunk_size, depth=depth))
+            seconds = time.perf_counter() - start
+            if [result.fen for result in results] != fens:
+                raise AssertionError("Batch results missing or out of order")
+            print("%8d %6d %12.1f" % (workers, chunk_size, count / seconds))
+
+
+def bench_lazy_smp(worker_counts=(1, 2, 4, 8), depth=5, position="italian"):
+    """Time to depth, speedup over one worker and total nodes per second of the Lazy SMP search"""
+    print("%d cores, searching %s to depth %d" % (os.cpu_count() or 1, position, depth))
+    print("%8s %10s %8s %8s %10s %s" % ("workers", "nodes", "seconds", "speedup", "nps", "best"))
+    single = None
+    for workers in worker_counts:
+        gs = play_moves(Chess_Engine.GameState(), POSITIONS[position])
+        result = Chess_SMP.ParallelSearcher(workers).search(gs, max_depth=depth)
+        if single is None:
+            single = result.seconds
+        print("%8d %10d %8.2f %7.2fx %10.0f %s" % (workers, result.nodes, result.seconds, single / result.seconds,
+                                                   result.nps, result.best_move.get_chess_notation()))
+
+
+def bench_promotions(repeats=500):
+    """Time per get_valid_moves call in positions with and without promoting pawns, to show
+    the extra promotion moves only cost anything where a pawn is about to promote"""
+    positions = [(name, play_moves(Chess_Engine.GameState(), moves)) for name, moves in POSITIONS.items()]
+    for name, fen, _ in Chess_Perft.SUITE:
+        if name in ("position 4", "position 5"):
+            positions.append((name, Chess_Engine.GameState.from_fen(fen)))
+    print("%-18s %6s %11s %12s" % ("position", "moves", "promotions", "per call"))
+    for name, gs in positions:
+        moves = gs.get_valid_moves()
+        promotions = sum(1 for move in moves if move.is_pawn_promotion)
+        print("%-18s %6d %11d %10.3fms" % (name, len(moves), promotions, time_valid_moves(gs, repeats) * 1000))
+
+
+def bench_move_cache(games=20, max_plies=80, seed=3, cache_size=4096):
+    """Seconds to play random games, take every move back and play them again, as the z key does
+    in Chess_Main, with and without a MoveCache, checking both give the same moves"""
+    print("%-10s %9s %9s %s" % ("cache", "seconds", "speedup", "stats"))
+    baseline = None
+    for cache in (None, Chess_Engine.MoveCache(cache_size)):
+        rng = random.Random(seed)
+        generated = []
+        start = time.perf_counter()
+        for _ in range(games):
+            gs = Chess_Engine.GameState()
+            gs.move_cache = cache
+            for _ in range(max_plies):
+                moves = gs.get_valid_moves()
+                generated.append(len(moves))
+                if not moves:
+                    break
+                gs.make_move(rng.choice(moves))
+            played = gs.movelog[:]
+            while gs.movelog:
+                gs.undoMove()
+                generated.append(len(gs.get_valid_moves()))
+            for move in played:
+                gs.make_move(move)
+                generated.append(len(gs.get_valid_moves()))
+        seconds = time.perf_counter() - start
+        if baseline is None:
+            baseline = (seconds, generated)
+        elif generated != baseline[1]:
+            raise AssertionError("Cached move lists differ from generated ones")
+        print("%-10s %9.3f %8.2fx %s" % ("none" if cache is None else cache.size, seconds, baseline[0] / seconds,
+                                         "" if cache is None else cache.stats()))
+
+
+def bench_make_undo(repeats=300, plies=60, seed=1):
+    """Microseconds per make_move + undoMove pair over every legal move of each position, bytes the
+    game state keeps per ply of history, and the peak memory allocated during a perft"""
+    seconds = 0.0
+    pairs = 0
+    for name, moves in POSITIONS.items():
+        gs = play_moves(Chess_Engine.GameState(), moves)
+        legal = gs.get_valid_moves()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for move in legal:
+                gs.make_move(move)
+                gs.undoMove()
+        seconds += time.perf_counter() - start
+        pairs += repeats * len(legal)
+    rng = random.Random(seed)
+    gs = play_moves(Chess_Engine.GameState(), POSITIONS["open middlegame"])
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    played = 0
+    for _ in range(plies):
+        moves = gs.get_valid_moves()
+        if not moves:
+            break
+        gs.make_move(rng.choice(moves))
+        played += 1
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    Chess_Perft.perft(gs, 2)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    print("make+undo %.2fus, %d bytes kept per ply (moves included), perft 2 peak %d bytes" % (
+        seconds / pairs * 1e6, held // max(played, 1), peak))
+
+
+def bench_evaluation(repeats=20000):
+    """Cost of an evaluation from the incremental terms against rescanning the board"""
+    gs = play_moves(Chess_Engine.GameState(), POSITIONS["open middlegame"])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        Chess_Evaluation.evaluate(gs)
+    incremental = (time.perf_counter() - start) / repeats
+    start = time.perf_counter()
+    for _ in range(repeats):
+        Chess_Evaluation.compute_terms(gs.board)
+    full = (time.perf_counter() - start) / repeats
+    print("incremental %.2fus, full rescan %.2fus per evaluation" % (incremental * 1e6, full * 1e6))
+
+
+if __name__ == "__main__":
+    bench_attack_detection()
+    print()
+    bench_legal_generator()
+    print()
+    bench_bitboard_backend()
+    print()
+    bench_move_size()
+    print()
+    bench_tt_sizes()
+    print()
+    bench_move_ordering()
+    print()
+    bench_evaluation()
+    print()
+    bench_quiescence()
+    print()
+    bench_fen_loading()
+    print()
+    bench_pgn()
+    print()
+    bench_batch()
+    print()
+    bench_lazy_smp()
+    print()
+    bench_promotions()
+    print()
+    bench_move_cache()
+    print()
+    bench_make_undo()
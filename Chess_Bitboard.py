@@ -0,0 +1,314 @@
+"""Bitboard backend for the GameState in Chess_Engine.
+Every piece type of each colour is kept as a 64 bit integer with one bit per square.
+Square index is row * 8 + col, so bit 0 is a8 and bit 63 is h1, matching the rows and
+columns of GameState.board. The list board is still kept up to date so the Move objects
+and Chess_Main work exactly as with the list backend.
+Attacks, pins and checks are found from the bitboards, but bench_bitboard_backend still measures
+this backend 5 to 10 percent slower than the list one: most of the time goes into making the Move
+objects and filtering them, which both backends share.
+"""
+
+import Chess_Engine
+
+PIECES = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
+FULL_BOARD = (1 << 64) - 1
+SQUARES = [divmod(sq, 8) for sq in range(64)] #(row, col) of every square index
+
+
+def _on_board(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+
+def _step_table(directions):
+    """Squares reached by a single step in each direction from every square"""
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in directions:
+            if _on_board(r + dr, c + dc):
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return table
+
+
+def _ray_table(dr, dc):
+    """Squares reached sliding in one direction from every square on an empty board"""
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        x, y = r + dr, c + dc
+        while _on_board(x, y):
+            bb |= 1 << (x * 8 + y)
+            x += dr
+            y += dc
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table(Chess_Engine.knight_directions)
+KING_ATTACKS = _step_table(Chess_Engine.king_directions)
+#squares attacked by a pawn of the given colour standing on each square
+PAWN_ATTACKS = {'w': _step_table(((-1, -1), (-1, 1))), 'b': _step_table(((1, -1), (1, 1)))}
+
+def _line_tables():
+    """Squares strictly between two squares sharing a rank, file or diagonal (0 when they do not),
+    and the squares on the rook lines and bishop lines through every square"""
+    between = [[0] * 64 for _ in range(64)]
+    rook_lines = [0] * 64
+    bishop_lines = [0] * 64
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        for dr, dc in Chess_Engine.king_directions:
+            lines = rook_lines if dr == 0 or dc == 0 else bishop_lines
+            squares = 0
+            x, y = r + dr, c + dc
+            while _on_board(x, y):
+                between[sq][x * 8 + y] = squares
+                squares |= 1 << (x * 8 + y)
+                x += dr
+                y += dc
+            lines[sq] |= squares
+    return between, rook_lines, bishop_lines
+
+
+#Rays going towards higher square indexes stop at their lowest set blocker,
+#rays going towards lower indexes stop at their highest set blocker
+POSITIVE_ROOK_RAYS = [_ray_table(1, 0), _ray_table(0, 1)]
+NEGATIVE_ROOK_RAYS = [_ray_table(-1, 0), _ray_table(0, -1)]
+POSITIVE_BISHOP_RAYS = [_ray_table(1, 1), _ray_table(1, -1)]
+NEGATIVE_BISHOP_RAYS = [_ray_table(-1, -1), _ray_table(-1, 1)]
+BETWEEN, ROOK_LINES, BISHOP_LINES = _line_tables()
+
+
+def sliding_attacks(sq, occupied, positive_rays, negative_rays):
+    """Squares attacked from sq along the given rays, stopping at (and including) the first blocker"""
+    attacks = 0
+    for rays in positive_rays:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in negative_rays:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq, occupied):
+    return sliding_attacks(sq, occupied, POSITIVE_ROOK_RAYS, NEGATIVE_ROOK_RAYS)
+
+
+def bishop_attacks(sq, occupied):
+    return sliding_attacks(sq, occupied, POSITIVE_BISHOP_RAYS, NEGATIVE_BISHOP_RAYS)
+
+
+class BitboardGameState(Chess_Engine.GameState):
+    """GameState that generates moves and detects attacks with bitboards"""
+    def __init__(self):
+        super().__init__()
+        self.rebuild_bitboards()
+
+    def load_fen(self, fen):
+        super().load_fen(fen)
+        self.rebuild_bitboards()
+
+    '''
+    Rebuild every bitboard from the list board. Call after editing board directly
+    '''
+    def rebuild_bitboards(self):
+        self.bitboards = {piece: 0 for piece in PIECES}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.bitboards[piece] |= 1 << (r * 8 + c)
+        self.occupied = {'w': 0, 'b': 0}
+        for piece, bb in self.bitboards.items():
+            self.occupied[piece[0]] |= bb
+
+    '''
+    Flip the bits for every square changed by the move. XOR makes this its own inverse,
+    so the same call is used by make_move and undoMove. piece_placed is what ends up on the
+    end square, which differs from piece_moved for promotions
+    '''
+    def toggle_move_bits(self, move, piece_placed):
+        start = move.start_row * 8 + move.start_col
+        end = move.end_row * 8 + move.end_col
+        color = move.piece_moved[0]
+        self.bitboards[move.piece_moved] ^= 1 << start
+        self.bitboards[piece_placed] ^= 1 << end
+        self.occupied[color] ^= (1 << start) | (1 << end)
+        if move.place_captured != "--":
+            captured = move.start_row * 8 + move.end_col if move.is_enpassent_move else end
+            self.bitboards[move.place_captured] ^= 1 << captured
+            self.occupied[move.place_captured[0]] ^= 1 << captured
+        if move.is_castle_move:
+            if move.end_col - move.start_col == 2: #king side, rook from h file to f file
+                rook_bits = (1 << (end + 1)) | (1 << (end - 1))
+            else: #queen side, rook from a file to d file
+                rook_bits = (1 << (end - 2)) | (1 << (end + 1))
+            self.bitboards[color + 'R'] ^= rook_bits
+            self.occupied[color] ^= rook_bits
+
+    def make_move(self, move):
+        super().make_move(move)
+        self.toggle_move_bits(move, self.board[move.end_row][move.end_col])
+
+    def undoMove(self):
+        if len(self.movelog) != 0:
+            move = self.movelog[-1]
+            self.toggle_move_bits(move, self.board[move.end_row][move.end_col])
+        super().undoMove()
+
+    '''
+    Bitboard of the pieces of attacker_color that attack sq, given the occupied squares
+    '''
+    def attackers_to(self, sq, attacker_color, occupied):
+        bitboards = self.bitboards
+        defender_color = 'b' if attacker_color == 'w' else 'w'
+        attackers = KNIGHT_ATTACKS[sq] & bitboards[attacker_color + 'N']
+        attackers |= KING_ATTACKS[sq] & bitboards[attacker_color + 'K']
+        #a pawn of attacker_color attacks sq from the squares a defender pawn on sq would attack
+        attackers |= PAWN_ATTACKS[defender_color][sq] & bitboards[attacker_color + 'p']
+        queens = bitboards[attacker_color + 'Q']
+        attackers |= rook_attacks(sq, occupied) & (bitboards[attacker_color + 'R'] | queens)
+        attackers |= bishop_attacks(sq, occupied) & (bitboards[attacker_color + 'B'] | queens)
+        return attackers
+
+    '''
+    The same pins and checks as GameState.check_for_pins_and_checks, found from the bitboards.
+    Every enemy slider on a line through the king checks it when nothing stands between them and
+    pins the piece between them when that is the only one and it is the king's own
+    '''
+    def check_for_pins_and_checks(self):
+        if self.whiteToMove:
+            enemy_color, ally_color = 'b', 'w'
+            start_row, start_col = self.white_king_location
+        else:
+            enemy_color, ally_color = 'w', 'b'
+            start_row, start_col = self.black_king_location
+        king = start_row * 8 + start_col
+        bitboards = self.bitboards
+        own = self.occupied[ally_color]
+        occupied = own | self.occupied[enemy_color]
+        pins = {}
+        checks = []
+        queens = bitboards[enemy_color + 'Q']
+        sliders = ROOK_LINES[king] & (bitboards[enemy_color + 'R'] | queens) | \
+            BISHOP_LINES[king] & (bitboards[enemy_color + 'B'] | queens)
+        between = BETWEEN[king]
+        while sliders:
+            bit = sliders & -sliders
+            sliders ^= bit
+            sq = bit.bit_length() - 1
+            blockers = between[sq] & occupied
+            if blockers & (blockers - 1): #two or more pieces in the way
+                continue
+            x, y = SQUARES[sq]
+            direction = ((x > start_row) - (x < start_row), (y > start_col) - (y < start_col))
+            if not blockers:
+                checks.append((x, y) + direction)
+            elif blockers & own:
+                pins[SQUARES[blockers.bit_length() - 1]] = direction
+        #knights and pawns next to the king, their offset from it is their direction
+        attackers = KNIGHT_ATTACKS[king] & bitboards[enemy_color + 'N'] | \
+            PAWN_ATTACKS[ally_color][king] & bitboards[enemy_color + 'p']
+        while attackers:
+            bit = attackers & -attackers
+            attackers ^= bit
+            x, y = SQUARES[bit.bit_length() - 1]
+            checks.append((x, y, x - start_row, y - start_col))
+        return len(checks) > 0, pins, checks
+
+    def square_under_attack(self, r, c):
+        enemy_color = 'b' if self.whiteToMove else 'w'
+        return self.attackers_to(r * 8 + c, enemy_color, self.occupied['w'] | self.occupied['b']) != 0
+
+    def king_move_is_safe(self, move):
+        enemy_color = 'b' if self.whiteToMove else 'w'
+        #lift the king off the board so it cannot block a slider checking along its line
+        occupied = (self.occupied['w'] | self.occupied['b']) ^ (1 << (move.start_row * 8 + move.start_col))
+        return self.attackers_to(move.end_row * 8 + move.end_col, enemy_color, occupied) == 0
+
+    '''
+    Add a Move from sq to every square in targets
+    '''
+    def add_moves(self, sq, targets, moves):
+        start = SQUARES[sq]
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            moves.append(Chess_Engine.Move(start, SQUARES[bit.bit_length() - 1], self.board))
+
+    def get_all_possible_moves(self):
+        moves = []
+        ally_color = 'w' if self.whiteToMove else 'b'
+        enemy_color = 'b' if self.whiteToMove else 'w'
+        own = self.occupied[ally_color]
+        enemy = self.occupied[enemy_color]
+        occupied = own | enemy
+        self.add_pawn_moves(ally_color, enemy, occupied, moves)
+        for piece in 'NBRQK':
+            pieces = self.bitboards[ally_color + piece]
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                sq = bit.bit_length() - 1
+                if piece == 'N':
+                    targets = KNIGHT_ATTACKS[sq]
+                elif piece == 'B':
+                    targets = bishop_attacks(sq, occupied)
+                elif piece == 'R':
+                    targets = rook_attacks(sq, occupied)
+                elif piece == 'Q':
+                    targets = rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+                else:
+                    targets = KING_ATTACKS[sq]
+                self.add_moves(sq, targets & ~own, moves)
+        return moves
+
+    def add_pawn_moves(self, ally_color, enemy, occupied, moves):
+        pawns = self.bitboards[ally_color + 'p']
+        empty = ~occupied & FULL_BOARD
+        if self.enpassent_possible:
+            enemy |= 1 << (self.enpassent_possible[0] * 8 + self.enpassent_possible[1])
+        step = -8 if ally_color == 'w' else 8
+        start_row = 6 if ally_color == 'w' else 1
+        promotion_row = 1 if ally_color == 'w' else 6 #pawns on this row promote with every move
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            sq = bit.bit_length() - 1
+            r, c = SQUARES[sq]
+            one_step = sq + step
+            if r == promotion_row:
+                targets = PAWN_ATTACKS[ally_color][sq] & enemy | (empty & 1 << one_step)
+                while targets:
+                    target = targets & -targets
+                    targets ^= target
+                    end = SQUARES[target.bit_length() - 1]
+                    for piece in Chess_Engine.promotion_pieces:
+                        moves.append(Chess_Engine.Move((r, c), end, self.board, promotion_piece=piece))
+                continue
+            if empty >> one_step & 1: #1 square pawn advance
+                moves.append(Chess_Engine.Move((r, c), SQUARES[one_step], self.board))
+                if r == start_row and empty >> (one_step + step) & 1: #2 square pawn advance
+                    moves.append(Chess_Engine.Move((r, c), SQUARES[one_step + step], self.board))
+            captures = PAWN_ATTACKS[ally_color][sq] & enemy
+            while captures:
+                target = captures & -captures
+                captures ^= target
+                end = SQUARES[target.bit_length() - 1]
+                moves.append(Chess_Engine.Move((r, c), end, self.board,
+                                               is_enpassent_move=(end == self.enpassent_possible)))
+
+    def get_king_moves(self, r, c, moves):
+        ally_color = 'w' if self.whiteToMove else 'b'
+        sq = r * 8 + c
+        self.add_moves(sq, KING_ATTACKS[sq] & ~self.occupied[ally_color], moves)
@@ -1,6 +1,74 @@
 """Responsible for storing the information about the current state of a chess game.
 Responsible for determining the valid moves at the current state, keeping a move log
 """
+import random
+from collections import OrderedDict
+import Chess_Evaluation
+
+#(row, col) offsets used when looking outward from a square for attackers
+knight_directions = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+king_directions = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+rook_directions = ((-1, 0), (1, 0), (0, -1), (0, 1))
+bishop_directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def _step_table(directions):
+    """For every square, the on-board squares one step away in each of the directions.
+    Indexed [row][col], each entry a tuple of (row, col)"""
+    return [[tuple((r + dr, c + dc) for dr, dc in directions if 0 <= r + dr < 8 and 0 <= c + dc < 8)
+             for c in range(8)] for r in range(8)]
+
+
+def _ray_table(directions):
+    """For every square, the rays going outward in each of the directions until the edge of the board.
+    Indexed [row][col], each entry a tuple of (direction, squares along the ray nearest first)"""
+    table = []
+    for r in range(8):
+        row = []
+        for c in range(8):
+            rays = []
+            for dr, dc in directions:
+                ray = []
+                x, y = r + dr, c + dc
+                while 0 <= x < 8 and 0 <= y < 8:
+                    ray.append((x, y))
+                    x += dr
+                    y += dc
+                if ray:
+                    rays.append(((dr, dc), tuple(ray)))
+            row.append(tuple(rays))
+        table.append(row)
+    return table
+
+
+#Lookup tables built once at import time, shared by move generation and attack detection
+knight_moves = _step_table(knight_directions)
+king_moves = _step_table(king_directions)
+rook_rays = _ray_table(rook_directions)
+bishop_rays = _ray_table(bishop_directions)
+queen_rays = _ray_table(rook_directions + bishop_directions)
+
+#Zobrist hashing: a fixed random 64 bit number for every piece on every square, for black to move,
+#for every combination of castling rights and for every en passent file. The key of a position is
+#the XOR of the numbers for everything in it, so a move only has to XOR the parts it changes
+_zobrist_random = random.Random(2020)
+zobrist_pieces = {piece: [_zobrist_random.getrandbits(64) for _ in range(64)]
+                  for piece in ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")}
+zobrist_black_to_move = _zobrist_random.getrandbits(64)
+zobrist_castling = [_zobrist_random.getrandbits(64) for _ in range(16)] #indexed by CastleRights.bits()
+zobrist_enpassent = [_zobrist_random.getrandbits(64) for _ in range(8)] #indexed by column
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+#FEN letters to board pieces and back
+fen_pieces = {'P': 'wp', 'N': 'wN', 'B': 'wB', 'R': 'wR', 'Q': 'wQ', 'K': 'wK',
+              'p': 'bp', 'n': 'bN', 'b': 'bB', 'r': 'bR', 'q': 'bQ', 'k': 'bK'}
+fen_letters = {piece: letter for letter, piece in fen_pieces.items()}
+
+promotion_pieces = ('Q', 'R', 'B', 'N') #in the order the move generators add them
+promotion_codes = {'Q': 1, 'R': 2, 'B': 3, 'N': 4} #stored in move_ID, 0 for moves that do not promote
+promotion_by_code = (None, 'Q', 'R', 'B', 'N')
+
 class GameState():
     def __init__(self):
         #board is an 8x8 2d array and each element has 2 characters..
@@ -26,9 +94,158 @@ class GameState():
         self.check_mate = False
         self.stale_mate = False
         self.enpassent_possible = () #coordinates for the square where the en passent capture is possible
-        self.current_castling_right = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.current_castling_right.wks, self.current_castling_right.bks,
-                                               self.current_castling_right.wqs, self.current_castling_right.bqs)]
+        self.current_castling_right = CastleRights(True, True, True, True) #changed in place, never replaced
+        self.in_check = False
+        self.pins = {} #pinned pieces and the direction of the pin from the king
+        self.checks = [] #pieces giving check and their direction from the king
+        self.reference_move_generation = False #use get_valid_moves_by_filtering in get_valid_moves
+        self.move_cache = None #optional MoveCache of legal move lists, shared by any number of game states
+        self.zobrist_key = self.compute_zobrist_key() #64 bit key of the position, updated by make_move/undoMove
+        self.zobrist_log = [self.zobrist_key] #key of every position in the game, one more than movelog
+        #evaluation terms from white's point of view, updated by make_move/undoMove
+        self.middlegame_score, self.endgame_score, self.game_phase = Chess_Evaluation.compute_terms(self.board)
+        self.debug_evaluation = False #check the incremental terms against a full recomputation in evaluate
+        self.halfmove_clock = 0 #plies since the last capture or pawn move
+        self.fullmove_number = 1 #starts at 1 and goes up after every black move
+        #one tuple per move in movelog with what undoMove cannot work out from the move itself:
+        #(castling bits, en passent square, halfmove clock, middlegame score, endgame score, phase) before it
+        self.undo_log = []
+
+    '''
+    A new game state set to the position in fen
+    '''
+    @classmethod
+    def from_fen(cls, fen):
+        gs = cls()
+        gs.load_fen(fen)
+        return gs
+
+    '''
+    Set this game state to the position in fen, forgetting the moves played so far. The board rows are
+    filled in place, so one GameState can be reused to read any number of positions. Raises ValueError
+    for a FEN that cannot be read, such as one without a king of each colour or with a pawn on the first
+    or last rank, and leaves the game state as it was. Castling rights whose king or rook is not on its
+    home square are dropped, and so is an en passent square with no pawn in front of it that just passed it
+    '''
+    def load_fen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        placement, turn, castling, enpassent = fields[:4]
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError("FEN placement needs 8 ranks: " + fen)
+        if turn not in ('w', 'b'):
+            raise ValueError("FEN side to move must be w or b: " + fen)
+        if castling.strip("KQkq-"):
+            raise ValueError("Bad FEN castling rights: " + fen)
+        #the en passent square is behind a pawn of the side that just moved
+        if enpassent != '-' and (len(enpassent) != 2 or enpassent[0] not in Move.files_to_cols or
+                                 enpassent[1] != ('6' if turn == 'w' else '3')):
+            raise ValueError("Bad FEN en passent square: " + fen)
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("Bad FEN move counters: " + fen) from None
+        board = [] #read into a new board first, so a bad FEN changes nothing
+        kings = {'wK': [], 'bK': []} #squares of the kings found, each side needs exactly one
+        for r in range(8):
+            row = []
+            for ch in ranks[r]:
+                if ch in fen_pieces:
+                    piece = fen_pieces[ch]
+                    if piece[1] == 'p' and r in (0, 7):
+                        raise ValueError("FEN has a pawn on rank %d: %s" % (8 - r, fen))
+                    if piece in kings:
+                        kings[piece].append((r, len(row)))
+                    row.append(piece)
+                elif '1' <= ch <= '8':
+                    row.extend(["--"] * int(ch))
+                else:
+                    raise ValueError("Bad FEN rank %d: %s" % (8 - r, fen))
+                if len(row) > 8:
+                    raise ValueError("FEN rank %d is too long: %s" % (8 - r, fen))
+            if len(row) != 8:
+                raise ValueError("FEN rank %d is too short: %s" % (8 - r, fen))
+            board.append(row)
+        if len(kings['wK']) != 1 or len(kings['bK']) != 1:
+            raise ValueError("FEN needs one king of each colour: " + fen)
+        castling_bits = 0
+        for letter, bit, row, king, rook_col in (('K', 1, 7, 'wK', 7), ('Q', 2, 7, 'wK', 0),
+                                                 ('k', 4, 0, 'bK', 7), ('q', 8, 0, 'bK', 0)):
+            if letter in castling and board[row][4] == king and board[row][rook_col] == king[0] + 'R':
+                castling_bits |= bit
+        enpassent_possible = ()
+        if enpassent != '-':
+            row, col = Move.ranks_to_rows[enpassent[1]], Move.files_to_cols[enpassent[0]]
+            pushed = (row + 1, 'bp') if turn == 'w' else (row - 1, 'wp') #where the pawn that passed stands
+            if board[pushed[0]][col] == pushed[1] and board[row][col] == "--":
+                enpassent_possible = (row, col)
+        for r in range(8):
+            self.board[r][:] = board[r]
+        self.white_king_location = kings['wK'][0]
+        self.black_king_location = kings['bK'][0]
+        self.whiteToMove = turn == 'w'
+        self.current_castling_right.set_bits(castling_bits)
+        self.enpassent_possible = enpassent_possible
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.movelog = []
+        self.undo_log = []
+        self.check_mate = False
+        self.stale_mate = False
+        self.in_check = False
+        self.pins = {}
+        self.checks = []
+        self.zobrist_key = self.compute_zobrist_key()
+        self.zobrist_log = [self.zobrist_key]
+        self.middlegame_score, self.endgame_score, self.game_phase = Chess_Evaluation.compute_terms(self.board)
+
+    '''
+    The current position as a FEN string
+    '''
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += fen_letters[piece]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        rights = self.current_castling_right
+        castling = ("K" if rights.wks else "") + ("Q" if rights.wqs else "") + \
+            ("k" if rights.bks else "") + ("q" if rights.bqs else "")
+        if self.enpassent_possible:
+            enpassent = Move.cols_to_files[self.enpassent_possible[1]] + Move.rows_to_ranks[self.enpassent_possible[0]]
+        else:
+            enpassent = "-"
+        return "%s %s %s %s %d %d" % ("/".join(ranks), "w" if self.whiteToMove else "b", castling or "-",
+                                      enpassent, self.halfmove_clock, self.fullmove_number)
+
+    '''
+    FEN of the position the game started from. The moves are taken back and played again, calling
+    before_move(move), if given, in the position each one is played from; the game ends up where it was
+    '''
+    def start_fen(self, before_move=None):
+        moves = []
+        while self.movelog:
+            moves.append(self.movelog[-1])
+            self.undoMove()
+        start_fen = self.to_fen()
+        for move in reversed(moves):
+            if before_move is not None:
+                before_move(move)
+            self.make_move(move)
+        return start_fen
 
 
 
@@ -36,6 +253,11 @@ class GameState():
     """
     Takes a move as a parameter and executes it. Does not work for castling and pawn promotion"""
     def make_move(self, move):
+        old_castling_bits = self.current_castling_right.bits()
+        old_enpassent = self.enpassent_possible
+        old_enpassent_key = self.enpassent_zobrist() if old_enpassent else 0 #the board is about to change
+        self.undo_log.append((old_castling_bits, old_enpassent, self.halfmove_clock, self.middlegame_score,
+                              self.endgame_score, self.game_phase))
         self.board[move.start_row][move.start_col] = "--"
         self.board[move.end_row][move.end_col] = move.piece_moved
         self.movelog.append(move) #add to the move log so it can be undone later
@@ -48,7 +270,7 @@ class GameState():
 
         #pawn promotion
         if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + 'Q'
+            self.board[move.end_row][move.end_col] = move.piece_moved[0] + move.promotion_piece
 
         #enpassent move
         if move.is_enpassent_move:
@@ -60,6 +282,14 @@ class GameState():
         else:
             self.enpassent_possible = ()
 
+        #fifty move counters
+        if move.piece_moved[1] == 'p' or move.place_captured != "--":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if move.piece_moved[0] == 'b':
+            self.fullmove_number += 1
+
         #castle move
         if move.is_castle_move:
             if move.end_col - move.start_col == 2: #king side castling
@@ -70,9 +300,45 @@ class GameState():
                 self.board[move.end_row][move.end_col - 2] = "--"
 
         #update castling rights : whenever it is a rook or king move
-        self.update_castle_rights(move)
-        self.castle_rights_log.append(CastleRights(self.current_castling_right.wks, self.current_castling_right.bks,
-                                               self.current_castling_right.wqs, self.current_castling_right.bqs))
+        if old_castling_bits: #nothing left to lose otherwise
+            self.update_castle_rights(move)
+
+        #update the zobrist key and evaluation terms with only what the move changed
+        start = move.start_row * 8 + move.start_col
+        end = move.end_row * 8 + move.end_col
+        piece_placed = self.board[move.end_row][move.end_col]
+        middlegame_scores = Chess_Evaluation.middlegame_scores
+        endgame_scores = Chess_Evaluation.endgame_scores
+        key = self.zobrist_key ^ zobrist_black_to_move
+        key ^= zobrist_pieces[move.piece_moved][start] ^ zobrist_pieces[piece_placed][end]
+        middlegame = self.middlegame_score - middlegame_scores[move.piece_moved][start] + \
+            middlegame_scores[piece_placed][end]
+        endgame = self.endgame_score - endgame_scores[move.piece_moved][start] + endgame_scores[piece_placed][end]
+        phase = self.game_phase
+        if move.is_pawn_promotion:
+            phase += Chess_Evaluation.piece_phase[piece_placed]
+        if move.place_captured != "--":
+            captured = move.start_row * 8 + move.end_col if move.is_enpassent_move else end
+            key ^= zobrist_pieces[move.place_captured][captured]
+            middlegame -= middlegame_scores[move.place_captured][captured]
+            endgame -= endgame_scores[move.place_captured][captured]
+            phase -= Chess_Evaluation.piece_phase[move.place_captured]
+        if move.is_castle_move:
+            rook = move.piece_moved[0] + 'R'
+            if move.end_col - move.start_col == 2: #rook went from the h file to the f file
+                rook_start, rook_end = end + 1, end - 1
+            else: #rook went from the a file to the d file
+                rook_start, rook_end = end - 2, end + 1
+            key ^= zobrist_pieces[rook][rook_start] ^ zobrist_pieces[rook][rook_end]
+            middlegame += middlegame_scores[rook][rook_end] - middlegame_scores[rook][rook_start]
+            endgame += endgame_scores[rook][rook_end] - endgame_scores[rook][rook_start]
+        key ^= zobrist_castling[old_castling_bits] ^ zobrist_castling[self.current_castling_right.bits()]
+        key ^= old_enpassent_key
+        if self.enpassent_possible:
+            key ^= self.enpassent_zobrist()
+        self.middlegame_score, self.endgame_score, self.game_phase = middlegame, endgame, phase
+        self.zobrist_key = key
+        self.zobrist_log.append(key)
 
     '''
     Undo the last made move
@@ -93,16 +359,17 @@ class GameState():
             if move.is_enpassent_move:
                 self.board[move.end_row][move.end_col] = '--' #leave landing square blank
                 self.board[move.start_row][move.end_col] = move.place_captured
-                self.enpassent_possible = (move.end_row, move.end_col)
 
-            #undo a 2 square pawn advance
-            if move.piece_moved[1] == 'p' and abs(move.start_row - move.end_row) == 2:
-                self.enpassent_possible = ()
+            #restore the castling rights, en passent square, fifty move clock and evaluation from before the move
+            castling_bits, self.enpassent_possible, self.halfmove_clock, self.middlegame_score, self.endgame_score, \
+                self.game_phase = self.undo_log.pop()
+            self.current_castling_right.set_bits(castling_bits)
+            if move.piece_moved[0] == 'b':
+                self.fullmove_number -= 1
 
-            #undo castling rights
-            self.castle_rights_log.pop() #get rid of the new castle rights from the move we are undoing
-            new_rights = self.castle_rights_log[-1] #set the current castle rights to the last one in the list
-            self.current_castling_right = CastleRights(new_rights.wks, new_rights.bks, new_rights.wqs, new_rights.bqs)
+            #restore the zobrist key from before the move
+            self.zobrist_log.pop()
+            self.zobrist_key = self.zobrist_log[-1]
 
             #undo the castle move
             if move.is_castle_move:
@@ -113,6 +380,40 @@ class GameState():
                     self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
                     self.board[move.end_row][move.end_col + 1] = "--"
 
+    '''
+    Zobrist key of the current position computed from scratch. make_move and undoMove keep
+    zobrist_key up to date incrementally, this is for setting up a position and for checking them
+    '''
+    def compute_zobrist_key(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    key ^= zobrist_pieces[piece][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= zobrist_black_to_move
+        key ^= zobrist_castling[self.current_castling_right.bits()]
+        if self.enpassent_possible:
+            key ^= self.enpassent_zobrist()
+        return key
+
+    '''
+    The part of the zobrist key for the en passent square: its file when a pawn of the side to move stands
+    next to the pawn that just advanced two squares, 0 otherwise. A square no pawn can capture on leaves the
+    key alone, so the same position always gets the same key however it was reached
+    '''
+    def enpassent_zobrist(self):
+        row, col = self.enpassent_possible
+        if self.whiteToMove: #black's pawn passed over row, white's pawns stand beside it on the row below
+            pawn_row, pawn = row + 1, 'wp'
+        else:
+            pawn_row, pawn = row - 1, 'bp'
+        beside = self.board[pawn_row]
+        if (col > 0 and beside[col - 1] == pawn) or (col < 7 and beside[col + 1] == pawn):
+            return zobrist_enpassent[col]
+        return 0
+
     """
         Update the castle rights given the move
         """
@@ -140,13 +441,167 @@ class GameState():
                 elif move.start_col == 7:  # right rook
                     self.current_castling_right.bks = False
 
+        #a rook captured on its starting square can no longer castle
+        if move.place_captured == 'wR':
+            if move.end_row == 7:
+                if move.end_col == 0:
+                    self.current_castling_right.wqs = False
+                elif move.end_col == 7:
+                    self.current_castling_right.wks = False
+        elif move.place_captured == 'bR':
+            if move.end_row == 0:
+                if move.end_col == 0:
+                    self.current_castling_right.bqs = False
+                elif move.end_col == 7:
+                    self.current_castling_right.bks = False
+
     '''
-    All Moves considering checks
+    All legal moves in the current position. Sets in_check, check_mate and stale_mate.
+    With a move_cache, a position seen before is answered from the cache
     '''
     def get_valid_moves(self):
-        temp_enpassent_possible = self.enpassent_possible
-        temp_castle_rights = CastleRights(self.current_castling_right.wks, self.current_castling_right.bks,
-                                          self.current_castling_right.wqs, self.current_castling_right.bqs) #copy the current castling rights
+        cache = self.move_cache
+        if cache is None:
+            return self.generate_valid_moves()
+        entry = cache.lookup(self.zobrist_key)
+        if entry is not None:
+            moves, self.in_check = entry
+            self.check_mate = not moves and self.in_check
+            self.stale_mate = not moves and not self.in_check
+            return list(moves)
+        moves = self.generate_valid_moves()
+        cache.store(self.zobrist_key, moves, self.in_check)
+        return moves
+
+    '''
+    All Moves considering checks
+    Works out checks and pins from the king first so only legal moves are produced
+    '''
+    def generate_valid_moves(self):
+        if self.reference_move_generation:
+            return self.get_valid_moves_by_filtering()
+        if self.whiteToMove:
+            king_row, king_col = self.white_king_location
+        else:
+            king_row, king_col = self.black_king_location
+        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        if self.in_check and len(self.checks) > 1: #double check, only the king can move
+            moves = []
+            self.get_king_moves(king_row, king_col, moves)
+        else:
+            moves = self.get_all_possible_moves()
+            if not self.in_check:
+                self.get_castle_moves(king_row, king_col, moves)
+        moves = self.remove_illegal_moves(moves, king_row, king_col)
+        if len(moves) == 0:
+            if self.in_check: #in check, hence, checkmate
+                self.check_mate = True
+            else: #stalemate
+                self.stale_mate = True
+        else:
+            self.check_mate = False
+            self.stale_mate = False
+        return moves
+
+    '''
+    Filter pseudo legal moves using the checks and pins found by check_for_pins_and_checks
+    '''
+    def remove_illegal_moves(self, moves, king_row, king_col):
+        if self.in_check:
+            #squares a non king move can go to: capture the checker or block the line of the check
+            check_row, check_col, dr, dc = self.checks[0]
+            valid_squares = {(check_row, check_col)}
+            if self.board[check_row][check_col][1] != 'N':
+                for i in range(1, 8):
+                    square = (king_row + dr * i, king_col + dc * i)
+                    valid_squares.add(square)
+                    if square == (check_row, check_col):
+                        break
+        legal_moves = []
+        for move in moves:
+            if move.start_row == king_row and move.start_col == king_col:
+                if move.is_castle_move or self.king_move_is_safe(move):
+                    legal_moves.append(move)
+            elif move.is_enpassent_move:
+                #removes two pawns from the same rank so verify it directly
+                self.make_move(move)
+                self.whiteToMove = not self.whiteToMove
+                if not self.inCheck():
+                    legal_moves.append(move)
+                self.whiteToMove = not self.whiteToMove
+                self.undoMove()
+            else:
+                pin = self.pins.get((move.start_row, move.start_col))
+                if pin is not None:
+                    #a pinned piece can only move along the line of the pin
+                    if (move.end_row - move.start_row) * pin[1] != (move.end_col - move.start_col) * pin[0]:
+                        continue
+                if self.in_check and (move.end_row, move.end_col) not in valid_squares:
+                    continue
+                legal_moves.append(move)
+        return legal_moves
+
+    '''
+    Determine if the king can go to the end square of the move. The king is lifted off the board
+    first so it cannot hide behind itself along the line of a slider check
+    '''
+    def king_move_is_safe(self, move):
+        king = self.board[move.start_row][move.start_col]
+        self.board[move.start_row][move.start_col] = "--"
+        safe = not self.square_under_attack(move.end_row, move.end_col)
+        self.board[move.start_row][move.start_col] = king
+        return safe
+
+    '''
+    Returns if the player is in check, a dict of pinned pieces and a list of checks.
+    pins maps (row, col) of a pinned piece to the direction of the pin from the king,
+    checks holds (row, col, dr, dc) of each checking piece and its direction from the king
+    '''
+    def check_for_pins_and_checks(self):
+        pins = {}
+        checks = []
+        in_check = False
+        if self.whiteToMove:
+            enemy_color, ally_color = 'b', 'w'
+            start_row, start_col = self.white_king_location
+        else:
+            enemy_color, ally_color = 'w', 'b'
+            start_row, start_col = self.black_king_location
+        board = self.board
+        for (dr, dc), ray in queen_rays[start_row][start_col]:
+            possible_pin = ()
+            sliders = 'RQ' if dr == 0 or dc == 0 else 'BQ'
+            for x, y in ray:
+                piece = board[x][y]
+                if piece[0] == ally_color and piece[1] != 'K':
+                    if possible_pin: #second allied piece, no pin or check in this direction
+                        break
+                    possible_pin = (x, y)
+                elif piece[0] == enemy_color:
+                    if piece[1] in sliders:
+                        if possible_pin:
+                            pins[possible_pin] = (dr, dc)
+                        else:
+                            in_check = True
+                            checks.append((x, y, dr, dc))
+                    elif piece[1] == 'p' and not possible_pin and x == start_row + dr and dc != 0 and \
+                            dr == (-1 if enemy_color == 'b' else 1):
+                        #enemy pawn next to the king, attacking towards it
+                        in_check = True
+                        checks.append((x, y, dr, dc))
+                    break
+        for x, y in knight_moves[start_row][start_col]:
+            if board[x][y] == enemy_color + 'N':
+                in_check = True
+                checks.append((x, y, x - start_row, y - start_col))
+        return in_check, pins, checks
+
+    '''
+    All Moves considering checks by making every pseudo legal move and dropping the ones
+    that leave the king attacked. Kept as a reference for the pins and checks generator
+    '''
+    def get_valid_moves_by_filtering(self):
+        #undoMove puts the en passent square and castling rights back, so they need no saving here
         # generate all possible moves
         moves = self.get_all_possible_moves()
         if self.whiteToMove:
@@ -163,17 +618,15 @@ class GameState():
                 moves.remove(moves[i]) # if they do, it's not a valid move
             self.whiteToMove = not self.whiteToMove
             self.undoMove()
+        self.in_check = self.inCheck()
         if len(moves) == 0:
-            if self.inCheck(): #in check, hence, checkmate
+            if self.in_check: #in check, hence, checkmate
                 self.check_mate = True
             else: #stalemate
                 self.stale_mate = True
         else:
             self.check_mate = False
             self.stale_mate = False
-
-        self.enpassent_possible = temp_enpassent_possible
-        self.current_castling_right = temp_castle_rights
         return moves
 
     '''
@@ -186,549 +639,226 @@ class GameState():
             return self.square_under_attack(self.black_king_location[0], self.black_king_location[1])
 
 
+    '''
+    True if the current position has occurred count times, counting this one. Only positions since
+    the last capture or pawn move can repeat, so the key history is scanned back no further than the
+    halfmove clock, and only every other entry since the same side has to be on move
+    '''
+    def is_repetition(self, count=3):
+        log = self.zobrist_log
+        key = self.zobrist_key
+        seen = 1
+        oldest = max(len(log) - 1 - self.halfmove_clock, 0)
+        for i in range(len(log) - 5, oldest - 1, -2): #a position cannot repeat within 4 plies
+            if log[i] == key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    '''
+    True if neither side has enough material left to checkmate: bare kings, a single minor piece,
+    or only bishops that all stand on squares of the same color
+    '''
+    def insufficient_material(self):
+        if self.game_phase > 2: #more material than two minor pieces
+            return False
+        bishop_square_colors = set()
+        minors = knights = 0
+        for r in range(8):
+            for c in range(8):
+                piece_type = self.board[r][c][1]
+                if piece_type in 'pRQ':
+                    return False
+                if piece_type == 'N':
+                    minors += 1
+                    knights += 1
+                elif piece_type == 'B':
+                    minors += 1
+                    bishop_square_colors.add((r + c) % 2)
+        return minors <= 1 or (knights == 0 and len(bishop_square_colors) == 1)
+
+    '''
+    Why the game is drawn in the current position, or None. Call after get_valid_moves, which finds
+    stalemate; a checkmate on the move that completes the fifty moves still wins
+    '''
+    def get_draw_reason(self):
+        if self.check_mate:
+            return None
+        if self.stale_mate:
+            return "stalemate"
+        if self.halfmove_clock >= 100:
+            return "fifty move rule"
+        if self.is_repetition(3):
+            return "threefold repetition"
+        if self.insufficient_material():
+            return "insufficient material"
+        return None
+
     '''
     Determine if the enemy can attack the square r, c
+    Looks outward from the square along knight, king, pawn and slider rays instead of
+    generating every opponent move, and returns as soon as an attacker is found
     '''
     def square_under_attack(self, r, c):
-        self.whiteToMove = not self.whiteToMove #switch to opponent's pov
-        opponent_moves = self.get_all_possible_moves()
-        self.whiteToMove = not self.whiteToMove  # switch turns back
-        for move in opponent_moves:
-            if move.end_row == r and move.end_col == c: #square under attack
+        enemy_color = 'b' if self.whiteToMove else 'w'
+        board = self.board
+        enemy_knight = enemy_color + 'N'
+        for x, y in knight_moves[r][c]:
+            if board[x][y] == enemy_knight:
+                return True
+        enemy_king = enemy_color + 'K'
+        for x, y in king_moves[r][c]:
+            if board[x][y] == enemy_king:
+                return True
+        #pawns attack diagonally towards their direction of travel
+        pawn_row = r + 1 if enemy_color == 'w' else r - 1
+        if 0 <= pawn_row < 8:
+            enemy_pawn = enemy_color + 'p'
+            if c - 1 >= 0 and board[pawn_row][c - 1] == enemy_pawn:
                 return True
+            if c + 1 <= 7 and board[pawn_row][c + 1] == enemy_pawn:
+                return True
+        #sliders: the first piece met along each ray decides
+        for _, ray in rook_rays[r][c]:
+            for x, y in ray:
+                piece = board[x][y]
+                if piece != "--":
+                    if piece[0] == enemy_color and (piece[1] == 'R' or piece[1] == 'Q'):
+                        return True
+                    break
+        for _, ray in bishop_rays[r][c]:
+            for x, y in ray:
+                piece = board[x][y]
+                if piece != "--":
+                    if piece[0] == enemy_color and (piece[1] == 'B' or piece[1] == 'Q'):
+                        return True
+                    break
         return False
 
+    '''
+    (row, col) of the least valuable piece of color attacking the square r, c, or None.
+    Pieces already lifted off the board are skipped, so sliders behind them are found, as
+    the static exchange evaluation needs
+    '''
+    def get_least_valuable_attacker(self, r, c, color):
+        board = self.board
+        pawn_row = r + 1 if color == 'w' else r - 1
+        if 0 <= pawn_row < 8:
+            for y in (c - 1, c + 1):
+                if 0 <= y < 8 and board[pawn_row][y] == color + 'p':
+                    return (pawn_row, y)
+        for x, y in knight_moves[r][c]:
+            if board[x][y] == color + 'N':
+                return (x, y)
+        #first piece along each ray, checked in order of value
+        heavy_attackers = []
+        for rays, sliders in ((bishop_rays, 'BQ'), (rook_rays, 'RQ')):
+            for _, ray in rays[r][c]:
+                for x, y in ray:
+                    piece = board[x][y]
+                    if piece != "--":
+                        if piece[0] == color and piece[1] in sliders:
+                            if piece[1] == 'B':
+                                return (x, y)
+                            heavy_attackers.append((piece[1], x, y))
+                        break
+        for piece_type in 'RQ':
+            for piece, x, y in heavy_attackers:
+                if piece == piece_type:
+                    return (x, y)
+        for x, y in king_moves[r][c]:
+            if board[x][y] == color + 'K':
+                return (x, y)
+        return None
+
     '''
     All moves without considering checks
     '''
     def get_all_possible_moves(self):
         moves = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                turn = self.board[r][c][0]
-                if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove):
-                    piece = self.board[r][c][1]
-                    self.move_functions[piece](r, c, moves)
+        ally_color = 'w' if self.whiteToMove else 'b'
+        for r in range(8):
+            row = self.board[r]
+            for c in range(8):
+                if row[c][0] == ally_color:
+                    self.move_functions[row[c][1]](r, c, moves)
         return moves
 
     '''
     Get all the pawn moves for the pawn at row, col and add these to the moves list
     '''
     def get_pawn_moves(self, r, c, moves):
-        if self.whiteToMove: #White to move
-            if self.board[r-1][c] == '--': #1 square pawn advance
-                moves.append(Move((r, c), (r-1, c), self.board))
-                if r == 6 and self.board[r-2][c] == "--": #2 square pawn advance
-                    moves.append(Move((r, c), (r-2, c), self.board))
-
-            if c-1 >= 0: #captures to the left
-                if self.board[r-1][c-1][0] == 'b': #black piece to capture
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
-                elif (r-1, c-1) == self.enpassent_possible:
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board, is_enpassent_move=True))
-
-            if c+1 <= 7: #captures to the right
-                if self.board[r - 1][c + 1][0] == 'b':  # black piece to capture
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
-                elif (r-1, c+1) == self.enpassent_possible:
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board, is_enpassent_move=True))
-
+        if self.whiteToMove:
+            direction, start_row, enemy_color = -1, 6, 'b'
         else:
-            if self.board[r+1][c] == '--': #1 square pawn advance
-                moves.append(Move((r, c), (r+1, c), self.board))
-                if r == 1 and self.board[r+2][c] == "--": #2 square pawn advance
-                    moves.append(Move((r, c), (r+2, c), self.board))
-
-            if c-1 >= 0: #captures to the left
-                if self.board[r+1][c-1][0] == 'w': #white piece to capture
-                    moves.append(Move((r, c), (r+1, c-1), self.board))
-                elif (r+1, c-1) == self.enpassent_possible:
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, is_enpassent_move=True))
-
-            if c+1 <= 7: #captures to the right
-                if self.board[r+1][c + 1][0] == 'w':  # white piece to capture
-                    moves.append(Move((r, c), (r+1, c + 1), self.board))
-                elif (r+1, c+1) == self.enpassent_possible:
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, is_enpassent_move=True))
-
+            direction, start_row, enemy_color = 1, 1, 'w'
+        board = self.board
+        x = r + direction
+        if x == 0 or x == 7: #every move of this pawn promotes
+            self.get_promotion_moves(r, c, x, enemy_color, moves)
+            return
+        if board[x][c] == '--': #1 square pawn advance
+            moves.append(Move((r, c), (x, c), board))
+            if r == start_row and board[x + direction][c] == "--": #2 square pawn advance
+                moves.append(Move((r, c), (x + direction, c), board))
+        for y in (c - 1, c + 1): #captures to the left and right
+            if 0 <= y <= 7:
+                if board[x][y][0] == enemy_color:
+                    moves.append(Move((r, c), (x, y), board))
+                elif (x, y) == self.enpassent_possible:
+                    moves.append(Move((r, c), (x, y), board, is_enpassent_move=True))
 
     '''
-        Get all the rook moves for the rook at row, col and add these to the moves list
+    Add a move for each promotion piece for a pawn on r, c that promotes on row x.
+    Kept apart from get_pawn_moves so pawns that are not about to promote pay nothing for it
     '''
+    def get_promotion_moves(self, r, c, x, enemy_color, moves):
+        board = self.board
+        for y in (c - 1, c, c + 1):
+            if 0 <= y <= 7 and (board[x][y] == "--" if y == c else board[x][y][0] == enemy_color):
+                for piece in promotion_pieces:
+                    moves.append(Move((r, c), (x, y), board, promotion_piece=piece))
 
-    def get_rook_moves(self, r, c, moves):
-        if self.whiteToMove:
-            # Explore the vertical top (r-1, c)
-            x = r
-            y = c
-
-            while True:
-                x -= 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'b':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'b':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-
-            # Explore the vertical bottom (r+1, c)
-            x = r
-            y = c
-
-            while True:
-                x += 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'b':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'b':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-            # Explore the horizontal right (r, c+1)
-            x = r
-            y = c
-
-            while True:
-                y += 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'b':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'b':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-            # Explore the horizontal left (r, c-1)
-            x = r
-            y = c
-
-            while True:
-                y -= 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'b':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'b':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-        else:
-            # Black movement
-            # Explore the vertical top (r-1, c)
-            x = r
-            y = c
-
-            while True:
-                x -= 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'w':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'w':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-
-            # Explore the vertical bottom (r+1, c)
-            x = r
-            y = c
-
-            while True:
-                x += 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'w':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'w':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-            # Explore the horizontal right (r, c+1)
-            x = r
-            y = c
-
-            while True:
-                y += 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'w':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'w':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-            # Explore the horizontal left (r, c-1)
-            x = r
-            y = c
-
-            while True:
-                y -= 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'w':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'w':
-                    moves.append(Move((r, c), (x, y), self.board))
+    '''
+    Add the moves along each ray from r, c up to the first piece, which is captured if it belongs to enemy_color
+    '''
+    def get_slider_moves(self, r, c, rays, enemy_color, moves):
+        board = self.board
+        for _, ray in rays[r][c]:
+            for x, y in ray:
+                piece = board[x][y]
+                if piece == "--":
+                    moves.append(Move((r, c), (x, y), board))
+                else:
+                    if piece[0] == enemy_color:
+                        moves.append(Move((r, c), (x, y), board))
                     break
 
-                moves.append(Move((r, c), (x, y), self.board))
+    '''
+    Add a move to each of the target squares that is empty or holds an enemy piece
+    '''
+    def get_step_moves(self, r, c, targets, enemy_color, moves):
+        board = self.board
+        for x, y in targets:
+            piece = board[x][y]
+            if piece == '--' or piece[0] == enemy_color: #Movement or capture the enemy piece
+                moves.append(Move((r, c), (x, y), board))
 
+    def get_rook_moves(self, r, c, moves):
+        self.get_slider_moves(r, c, rook_rays, 'b' if self.whiteToMove else 'w', moves)
 
     def get_knight_moves(self, r, c, moves):
-        if self.whiteToMove:
-            # Generate all possible moves
-            possible_moves = [(r+1, c+2), (r+1, c-2), (r-1, c-2), (r-1, c+2),
-                              (r+2, c+1), (r+2, c-1), (r-2, c+1), (r-2, c-1)]
-
-            def in_bounds(x, y):
-                r_in_bound = (x < len(self.board)) and (x >= 0)
-                c_in_bound = (y < len(self.board[0])) and (y >= 0)
-                return r_in_bound and c_in_bound
-
-            for i in possible_moves:
-                if in_bounds(i[0], i[1]):
-                    if self.board[i[0]][i[1]] == '--' or self.board[i[0]][i[1]][0] == 'b': #Movement or capture the enemy piece
-                        moves.append(Move((r, c), (i[0], i[1]), self.board))
-
-        else:
-            # Generate all possible moves
-            possible_moves = [(r + 1, c + 2), (r + 1, c - 2), (r - 1, c - 2), (r - 1, c + 2),
-                              (r + 2, c + 1), (r + 2, c - 1), (r - 2, c + 1), (r - 2, c - 1)]
-
-            def in_bounds(x, y):
-                r_in_bound = (x < len(self.board)) and (x >= 0)
-                c_in_bound = (y < len(self.board[0])) and (y >= 0)
-                return r_in_bound and c_in_bound
-
-            for i in possible_moves:
-                if in_bounds(i[0], i[1]):
-                    if self.board[i[0]][i[1]] == '--' or self.board[i[0]][i[1]][0] == 'w':  # Movement or capture the enemy piece
-                        moves.append(Move((r, c), (i[0], i[1]), self.board))
-
+        self.get_step_moves(r, c, knight_moves[r][c], 'b' if self.whiteToMove else 'w', moves)
 
     def get_bishop_moves(self, r, c, moves):
-        if self.whiteToMove:
-            # explore the top-left route (r-1, c-1)
-            x = r
-            y = c
-
-            while True:
-                x -= 1
-                y -= 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'b':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'b':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-
-
-            # explore the top-right route (r-1, c+1)
-            x = r
-            y = c
-            while True:
-                x -= 1
-                y += 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'b':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'b':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-            # explore the bottom-left route (r+1, c-1)
-            x = r
-            y = c
-            while True:
-                x += 1
-                y -= 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'b':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'b':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-            # explore the bottom-right route (r+1, c+1)
-            x = r
-            y = c
-            while True:
-                x += 1
-                y += 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'b':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'b':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-        else:
-            # explore the top-left route (r-1, c-1)
-            x = r
-            y = c
-
-            while True:
-                x -= 1
-                y -= 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'w':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'w':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-
-            # explore the top-right route (r-1, c+1)
-            x = r
-            y = c
-            while True:
-                x -= 1
-                y += 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'w':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'w':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-            # explore the bottom-left route (r+1, c-1)
-            x = r
-            y = c
-            while True:
-                x += 1
-                y -= 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'w':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'w':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-            # explore the bottom-right route (r+1, c+1)
-            x = r
-            y = c
-            while True:
-                x += 1
-                y += 1
-
-                # checking if you're still on the board
-                x_in_bounds = (x >= 0) and (x < len(self.board))
-                y_in_bounds = (y >= 0) and (y < len(self.board[0]))
-                on_the_board = x_in_bounds and y_in_bounds
-
-                if not on_the_board:
-                    break
-
-                # check if you hit another white piece and also ability to advance
-                if self.board[x][y] != "--" and self.board[x][y][0] != 'w':
-                    break
-
-                # check if black piece is in the way
-                elif self.board[x][y][0] == 'w':
-                    moves.append(Move((r, c), (x, y), self.board))
-                    break
-
-                moves.append(Move((r, c), (x, y), self.board))
-
-        # pass
+        self.get_slider_moves(r, c, bishop_rays, 'b' if self.whiteToMove else 'w', moves)
 
     def get_queen_moves(self, r, c, moves):
-        self.get_rook_moves(r, c, moves)
-        self.get_bishop_moves(r, c, moves)
+        self.get_slider_moves(r, c, queen_rays, 'b' if self.whiteToMove else 'w', moves)
 
     def get_king_moves(self, r, c, moves):
-        ally_color = 'w' if self.whiteToMove else 'b'
-        # Get all possible king movements
-        possible_moves = [(r+1, c), (r+1, c+1), (r+1, c-1), (r, c-1), (r, c+1), (r-1, c), (r-1, c+1), (r-1, c-1)]
-
-        def in_bounds(x, y):
-            r_in_bound = (x < len(self.board)) and (x >= 0)
-            c_in_bound = (y < len(self.board[0])) and (y >= 0)
-            return r_in_bound and c_in_bound
-
-        for i in possible_moves:
-            if in_bounds(i[0], i[1]):
-                if self.board[i[0]][i[1]] == '--' or self.board[i[0]][i[1]][0] != ally_color: #Movement or capture the enemy piece
-                    moves.append(Move((r, c), (i[0], i[1]), self.board))
-
-
+        self.get_step_moves(r, c, king_moves[r][c], 'b' if self.whiteToMove else 'w', moves)
 
     '''
     Generate all valid castle moves for the king at (r, c) and add them to the list of moves
@@ -752,6 +882,46 @@ class GameState():
             if not self.square_under_attack(r, c-1) and not self.square_under_attack(r, c-2):
                 moves.append(Move((r, c), (r, c-2), self.board, is_castle_move = True))
 
+class MoveCache():
+    '''
+    Legal move lists keyed by zobrist key, which covers the side to move, castling rights and the
+    en passent square as well as the pieces, so a key always gives the same moves and nothing has to be
+    invalidated when moves are made or taken back. Holds at most size positions and forgets the least
+    recently used first
+    '''
+    def __init__(self, size=4096):
+        self.size = size
+        self.entries = OrderedDict() #zobrist key -> (tuple of moves, in check)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, key, moves, in_check):
+        self.entries[key] = (tuple(moves), in_check) #a tuple so callers cannot change the cached list
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return "move cache %d/%d positions, hits %d (%.1f%%) misses %d evictions %d" % (
+            len(self.entries), self.size, self.hits, self.hits * 100 / lookups if lookups else 0.0, self.misses,
+            self.evictions)
+
+
 class CastleRights():
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks
@@ -759,7 +929,25 @@ class CastleRights():
         self.wqs = wqs
         self.bqs = bqs
 
+    '''
+    The rights packed into 4 bits: 1 white king side, 2 white queen side, 4 black king side, 8 black queen side
+    '''
+    def bits(self):
+        return self.wks | self.wqs << 1 | self.bks << 2 | self.bqs << 3
+
+    '''
+    Set the rights from bits packed by bits(), in place so undoing a move allocates nothing
+    '''
+    def set_bits(self, bits):
+        self.wks = bool(bits & 1)
+        self.wqs = bool(bits & 2)
+        self.bks = bool(bits & 4)
+        self.bqs = bool(bits & 8)
+
 class Move():
+    #fixed attributes instead of a per instance __dict__, move generation creates thousands of these
+    __slots__ = ('start_row', 'start_col', 'end_row', 'end_col', 'piece_moved', 'place_captured',
+                 'is_pawn_promotion', 'promotion_piece', 'is_enpassent_move', 'is_castle_move', 'move_ID')
 
     ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4,
                      "5": 3, "6": 2, "7": 1, "8": 0}
@@ -771,25 +959,45 @@ class Move():
 
     cols_to_files = {val: key for (key, val) in files_to_cols.items()}
 
-    def __init__(self, start_sq, end_sq, board, is_enpassent_move = False, is_castle_move = False):
-         self.start_row = start_sq[0]
-         self.start_col = start_sq[1]
-         self.end_row = end_sq[0]
-         self.end_col = end_sq[1]
-         self.piece_moved = board[self.start_row][self.start_col]
-         self.place_captured = board[self.end_row][self.end_col]
+    def __init__(self, start_sq, end_sq, board, is_enpassent_move = False, is_castle_move = False,
+                 promotion_piece = None):
+         self.start_row = start_row = start_sq[0]
+         self.start_col = start_col = start_sq[1]
+         self.end_row = end_row = end_sq[0]
+         self.end_col = end_col = end_sq[1]
+         self.piece_moved = piece_moved = board[start_row][start_col]
+         self.place_captured = board[end_row][end_col]
          #pawn promotion
-         self.is_pawn_promotion = (self.piece_moved == 'wp' and self.end_row == 0) or (self.piece_moved == 'bp' and self.end_row == 7)
+         self.is_pawn_promotion = (end_row == 0 or end_row == 7) and piece_moved[1] == 'p'
 
          #enpassent
          self.is_enpassent_move = is_enpassent_move
-         if self.is_enpassent_move:
-             self.place_captured = 'wp' if self.piece_moved == 'bp' else 'bp'
+         if is_enpassent_move:
+             self.place_captured = 'wp' if piece_moved == 'bp' else 'bp'
          #castling
          self.is_castle_move = is_castle_move
 
-         self.move_ID = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+         #start square (row * 8 + col) in the low 6 bits, end square in the next 6, promotion code above them
+         self.move_ID = (start_row * 8 + start_col) | (end_row * 8 + end_col) << 6
+         if self.is_pawn_promotion:
+             self.promotion_piece = promotion_piece or 'Q' #'Q', 'R', 'B' or 'N'
+             self.move_ID |= promotion_codes[self.promotion_piece] << 12
+         else:
+             self.promotion_piece = None
 
+    '''
+    Rebuild the full Move from a packed move_ID on the board it is played on. Castling and
+    en passent are recognised from the board, so only the squares and promotion piece need to be stored
+    '''
+    @classmethod
+    def from_move_ID(cls, move_ID, board):
+        start_row, start_col = divmod(move_ID & 63, 8)
+        end_row, end_col = divmod(move_ID >> 6 & 63, 8)
+        piece = board[start_row][start_col]
+        is_castle_move = piece[1] == 'K' and abs(end_col - start_col) == 2
+        is_enpassent_move = piece[1] == 'p' and start_col != end_col and board[end_row][end_col] == "--"
+        return cls((start_row, start_col), (end_row, end_col), board, is_enpassent_move, is_castle_move,
+                   promotion_by_code[move_ID >> 12 & 7])
 
     '''
     Overriding the equals method
@@ -799,8 +1007,14 @@ class Move():
             return self.move_ID == other.move_ID
         return False
 
+    def __hash__(self):
+        return self.move_ID
+
     def get_chess_notation(self):
-        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        notation = self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        if self.is_pawn_promotion:
+            notation += self.promotion_piece.lower() #e7e8q, as in UCI
+        return notation
 
     def get_rank_file(self, row, col):
-        return self.cols_to_files[col] + self.rows_to_ranks[row]
\ No newline at end of file
+        return self.cols_to_files[col] + self.rows_to_ranks[row]
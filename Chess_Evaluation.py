@@ -0,0 +1,180 @@
+"""Static evaluation: material and piece-square tables, tapered between middlegame and endgame.
+GameState keeps the middlegame score, endgame score and game phase up to date in make_move and
+undoMove using the tables here, so evaluate only has to blend three numbers at each leaf.
+Tables are written from white's point of view with row 0 being the 8th rank, as on GameState.board.
+"""
+
+middlegame_values = {'p': 82, 'N': 337, 'B': 365, 'R': 477, 'Q': 1025, 'K': 0}
+endgame_values = {'p': 94, 'N': 281, 'B': 297, 'R': 512, 'Q': 936, 'K': 0}
+phase_weights = {'p': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24 #all minor and major pieces on the board
+
+pawn_table = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [50, 50, 50, 50, 50, 50, 50, 50],
+    [10, 10, 20, 30, 30, 20, 10, 10],
+    [5, 5, 10, 25, 25, 10, 5, 5],
+    [0, 0, 0, 20, 20, 0, 0, 0],
+    [5, -5, -10, 0, 0, -10, -5, 5],
+    [5, 10, 10, -20, -20, 10, 10, 5],
+    [0, 0, 0, 0, 0, 0, 0, 0]]
+
+pawn_endgame_table = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [80, 80, 80, 80, 80, 80, 80, 80],
+    [50, 50, 50, 50, 50, 50, 50, 50],
+    [30, 30, 30, 30, 30, 30, 30, 30],
+    [20, 20, 20, 20, 20, 20, 20, 20],
+    [10, 10, 10, 10, 10, 10, 10, 10],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0]]
+
+knight_table = [
+    [-50, -40, -30, -30, -30, -30, -40, -50],
+    [-40, -20, 0, 0, 0, 0, -20, -40],
+    [-30, 0, 10, 15, 15, 10, 0, -30],
+    [-30, 5, 15, 20, 20, 15, 5, -30],
+    [-30, 0, 15, 20, 20, 15, 0, -30],
+    [-30, 5, 10, 15, 15, 10, 5, -30],
+    [-40, -20, 0, 5, 5, 0, -20, -40],
+    [-50, -40, -30, -30, -30, -30, -40, -50]]
+
+bishop_table = [
+    [-20, -10, -10, -10, -10, -10, -10, -20],
+    [-10, 0, 0, 0, 0, 0, 0, -10],
+    [-10, 0, 5, 10, 10, 5, 0, -10],
+    [-10, 5, 5, 10, 10, 5, 5, -10],
+    [-10, 0, 10, 10, 10, 10, 0, -10],
+    [-10, 10, 10, 10, 10, 10, 10, -10],
+    [-10, 5, 0, 0, 0, 0, 5, -10],
+    [-20, -10, -10, -10, -10, -10, -10, -20]]
+
+rook_table = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [5, 10, 10, 10, 10, 10, 10, 5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [0, 0, 0, 5, 5, 0, 0, 0]]
+
+queen_table = [
+    [-20, -10, -10, -5, -5, -10, -10, -20],
+    [-10, 0, 0, 0, 0, 0, 0, -10],
+    [-10, 0, 5, 5, 5, 5, 0, -10],
+    [-5, 0, 5, 5, 5, 5, 0, -5],
+    [0, 0, 5, 5, 5, 5, 0, -5],
+    [-10, 5, 5, 5, 5, 5, 0, -10],
+    [-10, 0, 5, 0, 0, 0, 0, -10],
+    [-20, -10, -10, -5, -5, -10, -10, -20]]
+
+king_table = [
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-20, -30, -30, -40, -40, -30, -30, -20],
+    [-10, -20, -20, -20, -20, -20, -20, -10],
+    [20, 20, 0, 0, 0, 0, 20, 20],
+    [20, 30, 10, 0, 0, 10, 30, 20]]
+
+king_endgame_table = [
+    [-50, -40, -30, -20, -20, -30, -40, -50],
+    [-30, -20, -10, 0, 0, -10, -20, -30],
+    [-30, -10, 20, 30, 30, 20, -10, -30],
+    [-30, -10, 30, 40, 40, 30, -10, -30],
+    [-30, -10, 30, 40, 40, 30, -10, -30],
+    [-30, -10, 20, 30, 30, 20, -10, -30],
+    [-30, -30, 0, 0, 0, 0, -30, -30],
+    [-50, -30, -30, -30, -30, -30, -30, -50]]
+
+middlegame_tables = {'p': pawn_table, 'N': knight_table, 'B': bishop_table, 'R': rook_table,
+                     'Q': queen_table, 'K': king_table}
+endgame_tables = {'p': pawn_endgame_table, 'N': knight_table, 'B': bishop_table, 'R': rook_table,
+                  'Q': queen_table, 'K': king_endgame_table}
+
+
+def _square_scores(values, tables):
+    """Value plus table bonus of every piece on every square, indexed [piece][row * 8 + col].
+    Black pieces use the table mirrored top to bottom and count negative"""
+    scores = {}
+    for piece_type, table in tables.items():
+        scores['w' + piece_type] = [values[piece_type] + table[r][c] for r in range(8) for c in range(8)]
+        scores['b' + piece_type] = [-(values[piece_type] + table[7 - r][c]) for r in range(8) for c in range(8)]
+    return scores
+
+
+#Score of each piece on each square from white's point of view, used for the incremental updates
+middlegame_scores = _square_scores(middlegame_values, middlegame_tables)
+endgame_scores = _square_scores(endgame_values, endgame_tables)
+piece_phase = {color + piece_type: weight for piece_type, weight in phase_weights.items() for color in 'wb'}
+
+
+def compute_terms(board):
+    """(middlegame score, endgame score, phase) of board computed from scratch"""
+    middlegame = endgame = phase = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != "--":
+                middlegame += middlegame_scores[piece][r * 8 + c]
+                endgame += endgame_scores[piece][r * 8 + c]
+                phase += piece_phase[piece]
+    return middlegame, endgame, phase
+
+
+def evaluate(gs):
+    """Score in centipawns from the point of view of the side to move, blending the middlegame
+    and endgame scores by how much material is left. With gs.debug_evaluation set, the
+    incremental terms are checked against a full recomputation"""
+    if gs.debug_evaluation:
+        terms = compute_terms(gs.board)
+        if terms != (gs.middlegame_score, gs.endgame_score, gs.game_phase):
+            raise AssertionError("Incremental evaluation %s does not match full evaluation %s after %s" % (
+                (gs.middlegame_score, gs.endgame_score, gs.game_phase), terms,
+                " ".join(move.get_chess_notation() for move in gs.movelog)))
+    phase = min(gs.game_phase, MAX_PHASE)
+    score = int((gs.middlegame_score * phase + gs.endgame_score * (MAX_PHASE - phase)) / MAX_PHASE)
+    return score if gs.whiteToMove else -score
+
+
+#Piece values for the static exchange evaluation. The king is worth more than anything it can win,
+#so a capture sequence never ends with the king taking a defended piece
+see_values = {'p': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 20000}
+
+
+def static_exchange(gs, move):
+    """Material the side to move wins or loses, in centipawns, if both sides keep recapturing on
+    the end square of move with their least valuable attacker and either may stop when it suits them.
+    Pieces are lifted off gs.board while the exchange is worked out and put back before returning"""
+    board = gs.board
+    r, c = move.end_row, move.end_col
+    lifted = [(move.start_row, move.start_col, move.piece_moved)]
+    board[move.start_row][move.start_col] = "--"
+    gains = [see_values[move.place_captured[1]] if move.place_captured != "--" else 0]
+    on_target = see_values[move.piece_moved[1]]
+    if move.is_pawn_promotion:
+        gains[0] += see_values[move.promotion_piece] - see_values['p']
+        on_target = see_values[move.promotion_piece]
+    if move.is_enpassent_move:
+        lifted.append((move.start_row, move.end_col, board[move.start_row][move.end_col]))
+        board[move.start_row][move.end_col] = "--"
+    color = 'b' if move.piece_moved[0] == 'w' else 'w'
+    while True:
+        attacker = gs.get_least_valuable_attacker(r, c, color)
+        if attacker is None:
+            break
+        x, y = attacker
+        #gain so far if this recapture is made
+        gains.append(on_target - gains[-1])
+        on_target = see_values[board[x][y][1]]
+        lifted.append((x, y, board[x][y]))
+        board[x][y] = "--"
+        color = 'b' if color == 'w' else 'w'
+    for x, y, piece in lifted:
+        board[x][y] = piece
+    #each side only recaptures when it does not lose by doing so
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
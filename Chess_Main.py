@@ -1,56 +1,119 @@
 """Driver File. Responsible for handling user input and current game state"""
 
+import collections
+import time
 import pygame as p
 import Chess_Engine
+import Chess_Search
+import Chess_Assets
+import Chess_Background
 
 # p.init()
 WIDTH = HEIGHT = 512
 DIMENSION = 8
 SQ_SIZE = HEIGHT // DIMENSION
-MAX_FPS = 15 #for animations
+MIN_SQ_SIZE = 16 #the board does not shrink below this when the window is made smaller
+MAX_FPS = 15 #frame rate when no piece is moving
 IMAGES = {}
+GAME_STATE = Chess_Engine.GameState #or Chess_Bitboard.BitboardGameState, imported, for the bitboard backend
+PLAYER_ONE = True #True if a human is playing white, False if the engine is
+PLAYER_TWO = True #True if a human is playing black, False if the engine is
+ENGINE_TIME = 2.0 #seconds the engine may think about each move
+MOVE_CACHE_SIZE = 4096 #positions whose legal moves are kept, so undoing and replaying moves is instant
+DIRTY_RECTS = True #redraw only the squares that changed and sleep while waiting for input, False redraws every frame
+ANIMATION_MS_PER_SQUARE = 125 #as fast as the old animation of 10 frames a square at 80 frames a second
+ANIMATION_MAX_MS = 600 #long moves are sped up to take no longer than this
+ANIMATION_FPS = 60 #frame rate asked for while a piece is moving, frames that come late skip ahead
+BACKGROUND = True #legal moves and engine searches in a worker process so the window never stops responding
+FRAME_TIMES_KEPT = 3600 #frames whose drawing time is kept for the report printed when the window closes
 
 """
-Initialize a global dict of images and will be called exactly once
+Fill the global dict of images with the pieces at the current SQ_SIZE. Chess_Assets reads the files
+only the first time and keeps the images of every size, so this is cheap when the window is resized
 """
 def load_images():
-    pieces = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
-    for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load("chess_images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+    IMAGES.update(Chess_Assets.piece_images(SQ_SIZE))
     #We can access an image by using the dictionary
 
+"""Fit the board to a window of width x height: the squares follow its shorter side"""
+def resize(width, height):
+    global WIDTH, HEIGHT, SQ_SIZE
+    SQ_SIZE = max(min(width, height) // DIMENSION, MIN_SQ_SIZE)
+    WIDTH = HEIGHT = SQ_SIZE * DIMENSION
+    load_images()
+
 """
 Main driver for the code.
 Handles user input and updates the graphics"""
 
 def main():
+    #started before pygame so the worker process does not inherit anything of SDL
+    worker = Chess_Background.BackgroundWorker(GAME_STATE, MOVE_CACHE_SIZE) if BACKGROUND else None
     p.init()
-    screen = p.display.set_mode((WIDTH, HEIGHT))
+    screen = p.display.set_mode((WIDTH, HEIGHT), p.RESIZABLE)
     p.display.set_caption("Chess")
-    icon = p.image.load("chess_images/bp.png")
+    icon = Chess_Assets.piece_image("bp")
     p.display.set_icon(icon)
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gstate = Chess_Engine.GameState()
-    valid_moves = gstate.get_valid_moves()
+    #the worker keeps its own cache and search, these are only needed without it
+    move_cache = Chess_Engine.MoveCache(MOVE_CACHE_SIZE) if worker is None else None #kept across games
+    searcher = Chess_Search.Searcher() if worker is None else None
+    gstate = GAME_STATE()
+    gstate.move_cache = move_cache
+    start_fen = gstate.to_fen() #the game is sent to the worker as this and the moves played
+    if worker is not None:
+        worker.request_moves(start_fen, [])
+        valid_moves = None #until the worker has sent them
+    else:
+        valid_moves = gstate.get_valid_moves()
+    thinking = False #the worker is searching for the engine's move
+    frame_times = collections.deque(maxlen=FRAME_TIMES_KEPT)
+    draw_reason = None #why the game is drawn, if it is
     move_made = False #flag for when a move is made
     animate = False #flag to animate
-    load_images() #Done only once before while loop
+    animation = None #the Animation of the move being shown
+    queued = [] #clicks made while a move was being made or shown, handled once it has finished
+    load_images() #again only when the window is resized
     game_is_on = True
     selected_square = ()
     playerClicks = [] #Keep track of player clicks
     game_over = False
+    background = draw_background()
+    shown = [None] * (DIMENSION * DIMENSION) #what each square showed last frame, None to redraw it
+    shown_text = None
+    waited = [] #event that woke the loop up from sleeping
+    if DIRTY_RECTS:
+        p.event.set_blocked(p.MOUSEMOTION) #nothing follows the mouse, so moving it need not wake the loop
 
     while game_is_on:
-        for e in p.event.get():
+        frame_start = time.perf_counter()
+        human_turn = (gstate.whiteToMove and PLAYER_ONE) or (not gstate.whiteToMove and PLAYER_TWO)
+        events = waited + p.event.get()
+        if animation is None:
+            events = queued + events
+            queued = []
+        for e in events:
             if e.type == p.QUIT:
                 game_is_on = False
+            elif e.type in (p.VIDEOEXPOSE, p.WINDOWEXPOSED): #the window has to be drawn again
+                shown = [None] * (DIMENSION * DIMENSION)
+            elif e.type == p.VIDEORESIZE:
+                resize(e.w, e.h)
+                screen = p.display.get_surface()
+                screen.fill(p.Color("white")) #the space beside the board when the window is not square
+                p.display.flip()
+                background = draw_background()
+                shown = [None] * (DIMENSION * DIMENSION)
             #mouse handler
+            elif e.type == p.MOUSEBUTTONDOWN and (animation is not None or move_made or valid_moves is None):
+                #after the move is shown and its replies are known
+                queued.append(e)
             elif e.type == p.MOUSEBUTTONDOWN:
-                if not game_over:
-                    location = p.mouse.get_pos() #mouse location (x, y)
-                    col = location[0] // SQ_SIZE
-                    row = location[1] // SQ_SIZE
+                location = e.pos #mouse location (x, y) when the button was pressed
+                col = location[0] // SQ_SIZE
+                row = location[1] // SQ_SIZE
+                if not game_over and human_turn and row < DIMENSION and col < DIMENSION: #beside a resized board
                     if selected_square == (row, col): #User clicked on the same square twice
                         selected_square = () #deselect
                         playerClicks = [] #Clear player clicks
@@ -59,7 +122,16 @@ def main():
                         playerClicks.append(selected_square) #append for both clicks
                     if len(playerClicks) == 2: #after 2nd click
                         move = Chess_Engine.Move(playerClicks[0], playerClicks[1], gstate.board)
-                        print(move.get_chess_notation())
+                        if move.is_pawn_promotion and move in valid_moves: #let the player pick the piece
+                            piece = choose_promotion(screen, gstate, move, clock)
+                            frame_start = time.perf_counter() #the time taken to choose is not the frame's
+                            screen = p.display.get_surface() #the window may have been resized meanwhile
+                            background = draw_background()
+                            shown = [None] * (DIMENSION * DIMENSION)
+                            move = Chess_Engine.Move(playerClicks[0], playerClicks[1], gstate.board,
+                                                     promotion_piece=piece) if piece else None
+                        if move is not None:
+                            print(move.get_chess_notation())
                         for i in range(len(valid_moves)):
                             if move == valid_moves[i]:
                                 gstate.make_move(valid_moves[i])
@@ -76,39 +148,151 @@ def main():
                     gstate.undoMove()
                     move_made = True
                     animate = False
+                    queued = [] #clicks meant for the position that was taken back
+                    if animation is not None: #stop showing the move that was taken back
+                        animation = None
+                        shown = [None] * (DIMENSION * DIMENSION)
 
                 if e.key == p.K_r: #reset the board when 'r' is pressed
-                    gstate = Chess_Engine.GameState()
-                    valid_moves = gstate.get_valid_moves()
+                    gstate = GAME_STATE()
+                    gstate.move_cache = move_cache
+                    start_fen = gstate.to_fen()
+                    game_over = False
                     selected_square = ()
                     playerClicks = []
-                    move_made = False
+                    move_made = True #to work out the legal moves of the new game
+                    animate = False
+                    queued = []
+                    if animation is not None:
+                        animation = None
+                        shown = [None] * (DIMENSION * DIMENSION)
+        if worker is not None and not move_made:
+            for result in worker.poll():
+                if result[0] == "error": #carry on without the worker
+                    print(result[2])
+                    worker.close()
+                    worker = None
+                    move_cache = gstate.move_cache = Chess_Engine.MoveCache(MOVE_CACHE_SIZE)
+                    searcher = Chess_Search.Searcher()
+                    thinking = False
+                    move_made = True #to work out the legal moves here
                     animate = False
+                    break
+                if result[0] == "moves":
+                    _, _, move_IDs, gstate.check_mate, gstate.stale_mate, draw_reason = result
+                    valid_moves = [Chess_Engine.Move.from_move_ID(move_ID, gstate.board) for move_ID in move_IDs]
+                else: #the engine's move, None when it had none
+                    thinking = False
+                    if result[2] is not None:
+                        print(result[3])
+                        gstate.make_move(Chess_Engine.Move.from_move_ID(result[2], gstate.board))
+                        move_made = True
+                        animate = True
+        #engine move, once the last move has been shown
+        if not game_over and not human_turn and not move_made and animation is None:
+            if worker is None:
+                result = searcher.search(gstate, time_limit=ENGINE_TIME)
+                if result is not None:
+                    print(result)
+                    gstate.make_move(result.best_move)
+                    move_made = True
+                    animate = True
+            elif valid_moves is not None and not thinking and game_end_text(gstate, draw_reason) is None:
+                #game_over is from the last frame, the moves that just arrived can end the game
+                worker.request_search(start_fen, [move.move_ID for move in gstate.movelog], ENGINE_TIME)
+                thinking = True
+
         if move_made:
             if animate:
-                animate_move(gstate.movelog[-1], screen, gstate.board, clock)
-            valid_moves = gstate.get_valid_moves()
+                animation = Animation(gstate.movelog[-1], p.time.get_ticks())
+            if worker is None:
+                valid_moves = gstate.get_valid_moves()
+                draw_reason = gstate.get_draw_reason()
+            else: #anything the worker is doing is for the position before
+                worker.new_generation()
+                worker.request_moves(start_fen, [move.move_ID for move in gstate.movelog])
+                valid_moves = None
+                draw_reason = None
+                gstate.check_mate = gstate.stale_mate = False
+                thinking = False
             move_made = False
             animate = False
 
-        draw_stage(screen, gstate, valid_moves, selected_square)
+        end_text = game_end_text(gstate, draw_reason)
+        game_over = end_text is not None #an undo can take the game back from its end
+        now = p.time.get_ticks()
+        if animation is not None and animation.finished(now):
+            if animation.drawn is not None:
+                invalidate_squares(shown, animation.drawn)
+            animation = None
+        hidden = animation.hidden_squares() if animation is not None else None
+        if DIRTY_RECTS:
+            if end_text != shown_text: #the text came or went, redraw everything it covers
+                shown = [None] * (DIMENSION * DIMENSION)
+                shown_text = end_text
+            if animation is not None and animation.drawn is not None: #squares the moving piece was drawn over
+                invalidate_squares(shown, animation.drawn)
+            dirty = draw_changed_squares(screen, background, gstate, valid_moves or [], selected_square, shown,
+                                         hidden)
+            if animation is not None:
+                animation.drawn = animation.rect(now)
+                screen.blit(IMAGES[animation.move.piece_moved], animation.drawn)
+                dirty.append(animation.drawn)
+            if end_text is not None and dirty:
+                dirty.append(draw_text(screen, end_text))
+            p.display.update(dirty)
+        else:
+            draw_stage(screen, gstate, valid_moves or [], selected_square, hidden)
+            if animation is not None:
+                screen.blit(IMAGES[animation.move.piece_moved], animation.rect(now))
+            if end_text is not None:
+                draw_text(screen, end_text)
+            p.display.flip()
+        frame_times.append(time.perf_counter() - frame_start)
+        busy = animation is not None or (worker is not None and worker.pending) #a result may arrive any time
+        clock.tick(ANIMATION_FPS if busy else MAX_FPS)
+        waited = []
+        human_turn = (gstate.whiteToMove and PLAYER_ONE) or (not gstate.whiteToMove and PLAYER_TWO)
+        if DIRTY_RECTS and game_is_on and not busy and (human_turn or game_over) and not queued:
+            waited = [p.event.wait()] #nothing will change until there is input
+    if worker is not None:
+        worker.close()
+    print(frame_time_report(frame_times))
 
-        if gstate.check_mate:
-            game_over = True
-            if gstate.whiteToMove:
-                draw_text(screen, 'Checkmate..... Black wins .....')
-            else:
-                draw_text(screen, 'Checkmate..... White wins .....')
+"""Frame count and how long frames took to handle input and draw, from the times in seconds"""
+def frame_time_report(frame_times):
+    if not frame_times:
+        return "no frames"
+    ordered = sorted(frame_times)
+    return "%d frames: %.2fms mean, %.2fms 99th percentile, %.2fms longest" % (
+        len(ordered), sum(ordered) * 1e3 / len(ordered), ordered[int(len(ordered) * 0.99)] * 1e3, ordered[-1] * 1e3)
 
-        elif gstate.stale_mate:
-            game_over = True
-            draw_text(screen, '.....Stalemate.....')
-
-        clock.tick(MAX_FPS)
-        p.display.flip()
+"""Text to show over the board when the game has ended, or None"""
+def game_end_text(gstate, draw_reason):
+    if gstate.check_mate:
+        if gstate.whiteToMove:
+            return 'Checkmate..... Black wins .....'
+        return 'Checkmate..... White wins .....'
+    if gstate.stale_mate:
+        return '.....Stalemate.....'
+    if draw_reason is not None:
+        return 'Draw..... ' + draw_reason + ' .....'
+    return None
 
 """Highlight square selected and moves for piece selected"""
 
+"""Colors of the squares highlight_squares tints, keyed by (row, col)"""
+def square_highlights(gs, valid_moves, sq_selected):
+    highlights = {}
+    if sq_selected != ():
+        r, c = sq_selected
+        if gs.board[r][c][0] == ("w" if gs.whiteToMove else "b"): #sq_selected is a piece that can be moved
+            highlights[(r, c)] = 'brown4'
+            for move in valid_moves:
+                if move.start_row == r and move.start_col == c:
+                    highlights[(move.end_row, move.end_col)] = 'bisque2'
+    return highlights
+
 def highlight_squares(screen, gs, valid_moves, sq_selected):
     if sq_selected != ():
         r, c = sq_selected
@@ -127,10 +311,47 @@ def highlight_squares(screen, gs, valid_moves, sq_selected):
 
 """
 Responsible for all the graphics within a current game state"""
-def draw_stage(screen, gstate, valid_moves, sq_selected):
+def draw_stage(screen, gstate, valid_moves, sq_selected, hidden=None):
     draw_board(screen) #draw the squares on the board
     highlight_squares(screen, gstate, valid_moves, sq_selected)
-    draw_pieces(screen, gstate.board) #draw pieces on top of the squares
+    draw_pieces(screen, gstate.board, hidden) #draw pieces on top of the squares
+
+"""The empty board drawn once onto its own surface, so squares can be cleared by copying from it"""
+def draw_background():
+    background = p.Surface((WIDTH, HEIGHT))
+    draw_board(background)
+    return background
+
+"""
+Redraw only the squares whose piece or highlight differs from what shown says they showed last frame,
+then update shown. hidden maps squares to the piece to show there instead of the one on the board.
+Returns the rects drawn, for p.display.update"""
+def draw_changed_squares(screen, background, gstate, valid_moves, sq_selected, shown, hidden=None):
+    highlights = square_highlights(gstate, valid_moves, sq_selected)
+    dirty = []
+    tint = None
+    for row in range(DIMENSION):
+        for col in range(DIMENSION):
+            piece = gstate.board[row][col]
+            if hidden is not None:
+                piece = hidden.get((row, col), piece)
+            highlight = highlights.get((row, col))
+            index = row * DIMENSION + col
+            if shown[index] == (piece, highlight):
+                continue
+            shown[index] = (piece, highlight)
+            square = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+            screen.blit(background, square, square)
+            if highlight is not None:
+                if tint is None:
+                    tint = p.Surface((SQ_SIZE, SQ_SIZE))
+                    tint.set_alpha(100)
+                tint.fill(p.Color(highlight))
+                screen.blit(tint, square)
+            if piece != "--":
+                screen.blit(IMAGES[piece], square)
+            dirty.append(square)
+    return dirty
 
 """"Draws the squares on the board"""
 def draw_board(screen):
@@ -142,48 +363,107 @@ def draw_board(screen):
             color = colors[((row + col) % 2)]
             p.draw.rect(screen, color, p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
 """Draws the pieces on the board using the current GameState.board"""
-def draw_pieces(screen, board):
+def draw_pieces(screen, board, hidden=None):
     for row in range(DIMENSION):
         for col in range(DIMENSION):
             piece = board[row][col]
+            if hidden is not None:
+                piece = hidden.get((row, col), piece)
 
             if piece != "--":
                 screen.blit(IMAGES[piece], p.Rect(col*SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
 
-"""Animating a move"""
-def animate_move(move, screen, board, clock):
-    global colors
-    dR = move.end_row - move.start_row
-    dC = move.end_col - move.start_col
-    frames_per_square = 10 #frames to move one square
-    frames_count = (abs(dR) + abs(dC)) * frames_per_square
-
-    for frame in range(frames_count+1):
-        r, c = (move.start_row + dR*frame/frames_count, move.start_col + dC*frame/frames_count)
-        draw_board(screen)
-        draw_pieces(screen, board)
-        #erase the piece moved from its ending square
-        color = colors[(move.end_row + move.end_col) % 2]
-        end_square = p.Rect(move.end_col*SQ_SIZE, move.end_row*SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, end_square)
-        #draw captured piece onto rectangle
-        if move.place_captured != "--":
-            screen.blit(IMAGES[move.place_captured], end_square)
-
-        #draw moving piece
-        screen.blit(IMAGES[move.piece_moved], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
-        clock.tick(80)
+"""Ask which piece a pawn promotes to. The choices are drawn in a column over the promotion square
+and the piece clicked is returned, or None if the click is anywhere else. The window may be resized
+meanwhile, so the caller has to pick up the display surface and SQ_SIZE again afterwards"""
+def choose_promotion(screen, gs, move, clock):
+    color = move.piece_moved[0]
+    step = 1 if move.end_row == 0 else -1 #the column runs from the promotion square towards the middle
+    choices = {}
+    for i, piece in enumerate(Chess_Engine.promotion_pieces):
+        choices[(move.end_row + i * step, move.end_col)] = piece
+    draw_promotion_choices(screen, gs, choices, color)
+    while True:
+        e = p.event.wait()
+        if e.type == p.QUIT:
+            p.event.post(e) #leave it for the main loop to close the game
+            return None
+        if e.type == p.MOUSEBUTTONDOWN:
+            location = e.pos
+            return choices.get((location[1] // SQ_SIZE, location[0] // SQ_SIZE))
+        if e.type in (p.VIDEOEXPOSE, p.WINDOWEXPOSED): #the window has to be drawn again
+            draw_promotion_choices(screen, gs, choices, color)
+        elif e.type == p.VIDEORESIZE:
+            resize(e.w, e.h)
+            screen = p.display.get_surface()
+            screen.fill(p.Color("white")) #the space beside the board when the window is not square
+            draw_promotion_choices(screen, gs, choices, color)
+        if e.type == p.KEYDOWN and e.key == p.K_ESCAPE:
+            return None
+        clock.tick(MAX_FPS)
+
+"""The board with the promotion choices, {(row, col): piece letter}, drawn over it"""
+def draw_promotion_choices(screen, gs, choices, color):
+    draw_stage(screen, gs, [], ())
+    for (row, col), piece in choices.items():
+        square = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        p.draw.rect(screen, p.Color("bisque2"), square)
+        p.draw.rect(screen, p.Color("brown4"), square, 2)
+        screen.blit(IMAGES[color + piece], square)
+    p.display.flip()
+
+
+"""
+A move sliding from its start square to its end square. Where the piece is comes from the time since the
+animation started, not from counting frames, so a late frame skips ahead instead of slowing the move down
+"""
+class Animation():
+    def __init__(self, move, start_ms):
+        self.move = move
+        self.start_ms = start_ms
+        squares = abs(move.end_row - move.start_row) + abs(move.end_col - move.start_col)
+        self.duration_ms = min(squares * ANIMATION_MS_PER_SQUARE, ANIMATION_MAX_MS)
+        self.drawn = None #rect the piece was last drawn in
+
+    '''
+    What to show instead of the board on squares the move has changed before the piece gets there:
+    the captured piece stays on its square and the end square is otherwise empty
+    '''
+    def hidden_squares(self):
+        move = self.move
+        if move.is_enpassent_move:
+            return {(move.end_row, move.end_col): "--", (move.start_row, move.end_col): move.place_captured}
+        return {(move.end_row, move.end_col): move.place_captured}
+
+    '''
+    Where the moving piece is drawn at now_ms
+    '''
+    def rect(self, now_ms):
+        move = self.move
+        fraction = min((now_ms - self.start_ms) / self.duration_ms, 1.0) if self.duration_ms else 1.0
+        row = move.start_row + (move.end_row - move.start_row) * fraction
+        col = move.start_col + (move.end_col - move.start_col) * fraction
+        return p.Rect(round(col * SQ_SIZE), round(row * SQ_SIZE), SQ_SIZE, SQ_SIZE)
+
+    def finished(self, now_ms):
+        return now_ms - self.start_ms >= self.duration_ms
+
+"""Mark every square rect overlaps to be drawn again by draw_changed_squares"""
+def invalidate_squares(shown, rect):
+    for row in range(max(rect.top // SQ_SIZE, 0), min((rect.bottom - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+        for col in range(max(rect.left // SQ_SIZE, 0), min((rect.right - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+            shown[row * DIMENSION + col] = None
 
 def draw_text(screen, text):
-    font = p.font.SysFont("comicsansms", 32, True, False)
-    text_object = font.render(text, 0, p.Color('Gray'))
+    size = SQ_SIZE // 2 #32 on the default board
+    text_object = Chess_Assets.text(text, "comicsansms", size, 'Gray', True)
     text_location = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - text_object.get_width()/2, HEIGHT/2 - text_object.get_height()/2)
     screen.blit(text_object, text_location)
-    text_object = font.render(text, 0, p.Color('Black'))
+    text_object = Chess_Assets.text(text, "comicsansms", size, 'Black', True)
     screen.blit(text_object, text_location.move(2, 2))
+    return p.Rect(text_location.x, text_location.y, text_object.get_width() + 2, text_object.get_height() + 2)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
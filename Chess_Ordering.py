@@ -0,0 +1,85 @@
+"""Move ordering for the search. get_valid_moves returns moves in board scan order, which is close
+to the worst case for alpha-beta. MoveOrderer hands them back in stages, best guesses first:
+    1. the transposition table move
+    2. captures and promotions, most valuable victim first, then least valuable attacker (MVV-LVA)
+    3. killer moves: quiet moves that caused a cutoff at the same ply elsewhere in the tree
+    4. the remaining quiet moves by history score
+Each stage is only sorted when the search gets to it, so a cutoff on an early move skips the
+work of ordering the quiet moves.
+"""
+
+#Piece order for MVV-LVA, pawn lowest
+victim_values = {'p': 1, 'N': 2, 'B': 3, 'R': 4, 'Q': 5, 'K': 6}
+KILLER_SLOTS = 2
+MAX_PLY = 128
+
+
+def mvv_lva(move):
+    """Capture score: the value of the victim dominates, the value of the attacker breaks ties"""
+    score = victim_values[move.place_captured[1]] * 10 if move.place_captured != "--" else 0
+    if move.is_pawn_promotion:
+        score += victim_values[move.promotion_piece] * 10
+    return score - victim_values[move.piece_moved[1]]
+
+
+class MoveOrderer():
+    def __init__(self):
+        self.killers = [[None] * KILLER_SLOTS for _ in range(MAX_PLY)] #move_IDs per ply
+        self.history = {} #(piece_moved, end row, end col) -> score of quiet moves that caused cutoffs
+
+    '''
+    Forget the killers and age the history between searches so old results count for less
+    '''
+    def new_search(self):
+        self.killers = [[None] * KILLER_SLOTS for _ in range(MAX_PLY)]
+        for key in self.history:
+            self.history[key] //= 2
+
+    '''
+    Yield moves in stages, only sorting a stage when it is reached
+    '''
+    def ordered_moves(self, moves, ply, tt_move_ID=None):
+        tt_move = None
+        captures = []
+        quiets = []
+        for move in moves:
+            if move.move_ID == tt_move_ID:
+                tt_move = move
+            elif move.place_captured != "--" or move.is_pawn_promotion:
+                captures.append(move)
+            else:
+                quiets.append(move)
+        if tt_move is not None:
+            yield tt_move
+        if captures:
+            captures.sort(key=mvv_lva, reverse=True)
+            yield from captures
+        if not quiets:
+            return
+        killer_IDs = self.killers[ply] if ply < MAX_PLY else ()
+        killers = []
+        for killer_ID in killer_IDs:
+            if killer_ID is not None:
+                for i, move in enumerate(quiets):
+                    if move.move_ID == killer_ID:
+                        killers.append(quiets.pop(i))
+                        break
+        yield from killers
+        history = self.history
+        quiets.sort(key=lambda move: history.get((move.piece_moved, move.end_row, move.end_col), 0), reverse=True)
+        yield from quiets
+
+    '''
+    Called when move caused a beta cutoff at depth and ply. Quiet moves become killers for the ply
+    and earn history in proportion to the size of the subtree they cut off
+    '''
+    def record_cutoff(self, move, depth, ply):
+        if move.place_captured != "--" or move.is_pawn_promotion:
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move.move_ID:
+                killers[1] = killers[0]
+                killers[0] = move.move_ID
+        key = (move.piece_moved, move.end_row, move.end_col)
+        self.history[key] = self.history.get(key, 0) + depth * depth
@@ -0,0 +1,257 @@
+"""Reading and writing games in PGN with moves in standard algebraic notation (SAN).
+read_games is a generator over a file or any other iterable of lines: it reads one line at a time
+and keeps only the game being read, so multi-gigabyte databases stream in constant memory.
+replay_games plays every game it reads on one reused GameState.
+Run directly to replay a file: python Chess_PGN.py games.pgn
+"""
+
+import re
+import sys
+import Chess_Engine
+
+STANDARD_TAGS = ("Event", "Site", "Date", "Round", "White", "Black", "Result") #the seven tag roster
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+LINE_LENGTH = 80
+
+_tag_pattern = re.compile(r'\[\s*(\w+)\s*"((?:[^"\\]|\\.)*)"\s*\]')
+#brackets of comments and variations, or anything else up to the next space or bracket
+_token_pattern = re.compile(r'[{}();]|[^\s{}();]+')
+_move_number_pattern = re.compile(r'^\d+\.+')
+_san_pattern = re.compile(r'([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+class PGNGame():
+    def __init__(self):
+        self.headers = {} #tag name -> value in the order they appeared
+        self.moves = [] #SAN strings of the main line
+        self.result = "*"
+
+    '''
+    The FEN of the starting position, from the FEN tag for games that do not start from the usual position
+    '''
+    def start_fen(self):
+        return self.headers.get("FEN", Chess_Engine.START_FEN)
+
+    '''
+    Play the game on gs, or a new GameState, from its starting position and return it
+    '''
+    def replay(self, gs=None):
+        if gs is None:
+            gs = Chess_Engine.GameState.from_fen(self.start_fen())
+        else:
+            gs.load_fen(self.start_fen())
+        for number, san in enumerate(self.moves):
+            try:
+                gs.make_move(parse_san(gs, san))
+            except ValueError as error:
+                raise ValueError("%s (ply %d of %s vs %s)" % (error, number + 1, self.headers.get("White", "?"),
+                                                             self.headers.get("Black", "?"))) from None
+        return gs
+
+
+def read_games(lines):
+    """Yield a PGNGame for every game in lines, an open file or any iterable of lines.
+    Comments, variations and numeric annotation glyphs are skipped"""
+    game = None
+    in_comment = False #inside a {...} comment, which can span lines
+    variation_depth = 0 #nesting of (...) variations
+    for line in lines:
+        if not in_comment:
+            stripped = line.strip()
+            if stripped.startswith('%'): #escaped line
+                continue
+            if stripped.startswith('[') and variation_depth == 0:
+                if game is not None and game.moves: #tags after movetext without a result start a new game
+                    yield game
+                    game = None
+                if game is None:
+                    game = PGNGame()
+                for name, value in _tag_pattern.findall(stripped):
+                    game.headers[name] = value.replace('\\"', '"').replace('\\\\', '\\')
+                continue
+        for token in _token_pattern.findall(line):
+            if in_comment:
+                in_comment = token != '}'
+                continue
+            if token == '{':
+                in_comment = True
+            elif token == ';': #rest of the line is a comment
+                break
+            elif token == '(':
+                variation_depth += 1
+            elif token == ')':
+                variation_depth = max(variation_depth - 1, 0)
+            elif variation_depth or token[0] == '$':
+                continue
+            else:
+                if game is None:
+                    game = PGNGame()
+                if token in RESULTS:
+                    game.result = token
+                    yield game
+                    game = None
+                    continue
+                token = _move_number_pattern.sub('', token)
+                if token:
+                    game.moves.append(token)
+    if game is not None and (game.moves or game.headers):
+        yield game
+
+
+def replay_games(lines, gs=None):
+    """Yield (PGNGame, GameState at the end of the game) for every game in lines.
+    The same GameState is reused for every game, so copy anything that has to outlive the next one"""
+    if gs is None:
+        gs = Chess_Engine.GameState()
+    for game in read_games(lines):
+        yield game, game.replay(gs)
+
+
+def parse_san(gs, san):
+    """The legal move of gs written as san. Raises ValueError if there is none or more than one"""
+    text = san.rstrip('+#!?')
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        long_castle = len(text) == 5
+        for move in gs.get_valid_moves():
+            if move.is_castle_move and (move.end_col < move.start_col) == long_castle:
+                return move
+        raise ValueError("Illegal move " + san)
+    match = _san_pattern.match(text)
+    if match is None:
+        raise ValueError("Not a SAN move: " + san)
+    piece, from_file, from_rank, target, promotion = match.groups()
+    piece = piece or 'p'
+    end_row = Chess_Engine.Move.ranks_to_rows[target[1]]
+    end_col = Chess_Engine.Move.files_to_cols[target[0]]
+    found = None
+    for move in gs.get_valid_moves():
+        if move.piece_moved[1] != piece or move.end_row != end_row or move.end_col != end_col or move.is_castle_move:
+            continue
+        if from_file is not None and move.start_col != Chess_Engine.Move.files_to_cols[from_file]:
+            continue
+        if from_rank is not None and move.start_row != Chess_Engine.Move.ranks_to_rows[from_rank]:
+            continue
+        if move.is_pawn_promotion:
+            if move.promotion_piece != (promotion or 'Q'): #a promotion written without the piece is a queen
+                continue
+        elif promotion is not None:
+            continue
+        if found is not None:
+            raise ValueError("Ambiguous move " + san)
+        found = move
+    if found is None:
+        raise ValueError("Illegal move " + san)
+    return found
+
+
+def move_to_san(gs, move):
+    """SAN of move, which must be legal in gs, including the + or # marker. gs is left as it was"""
+    if move.is_castle_move:
+        san = "O-O" if move.end_col > move.start_col else "O-O-O"
+    else:
+        piece = move.piece_moved[1]
+        target = move.get_rank_file(move.end_row, move.end_col)
+        capture = move.place_captured != "--"
+        if piece == 'p':
+            san = (move.cols_to_files[move.start_col] + "x" if capture else "") + target
+            if move.is_pawn_promotion:
+                san += "=" + move.promotion_piece
+        else:
+            #other pieces of the same kind that can also reach the target square
+            rivals = [other for other in gs.get_valid_moves() if other.piece_moved == move.piece_moved and
+                      other.end_row == move.end_row and other.end_col == move.end_col and other != move]
+            disambiguation = ""
+            if rivals:
+                if all(other.start_col != move.start_col for other in rivals):
+                    disambiguation = move.cols_to_files[move.start_col]
+                elif all(other.start_row != move.start_row for other in rivals):
+                    disambiguation = move.rows_to_ranks[move.start_row]
+                else:
+                    disambiguation = move.get_rank_file(move.start_row, move.start_col)
+            san = piece + disambiguation + ("x" if capture else "") + target
+    check_mate, stale_mate = gs.check_mate, gs.stale_mate
+    gs.make_move(move)
+    if gs.inCheck():
+        san += "#" if not gs.get_valid_moves() else "+"
+    gs.undoMove()
+    gs.check_mate, gs.stale_mate = check_mate, stale_mate
+    return san
+
+
+def game_sans(gs):
+    """(FEN the game started from, SAN of every move in gs.movelog). The moves are taken back
+    and played again to write them, gs ends up where it was"""
+    sans = []
+    check_mate, stale_mate = gs.check_mate, gs.stale_mate
+    start_fen = gs.start_fen(lambda move: sans.append(move_to_san(gs, move)))
+    gs.check_mate, gs.stale_mate = check_mate, stale_mate
+    return start_fen, sans
+
+
+def game_result(gs):
+    """PGN result of the position in gs: a win for the side giving mate, a draw on stalemate, repetition,
+    the fifty move rule or insufficient material, otherwise *"""
+    check_mate, stale_mate = gs.check_mate, gs.stale_mate
+    gs.get_valid_moves()
+    result = "*"
+    if gs.check_mate:
+        result = "0-1" if gs.whiteToMove else "1-0"
+    elif gs.get_draw_reason() is not None:
+        result = "1/2-1/2"
+    gs.check_mate, gs.stale_mate = check_mate, stale_mate
+    return result
+
+
+def game_to_pgn(gs, headers=None):
+    """The game played on gs as PGN text. Missing tags of the seven tag roster are filled with ?,
+    and the result is worked out from the final position unless headers give one"""
+    headers = dict(headers or {})
+    start_fen, sans = game_sans(gs)
+    headers.setdefault("Result", game_result(gs))
+    tags = {name: headers.get(name, "?") for name in STANDARD_TAGS}
+    if start_fen != Chess_Engine.START_FEN:
+        tags["SetUp"] = "1"
+        tags["FEN"] = start_fen
+    tags.update((name, value) for name, value in headers.items() if name not in tags)
+    lines = ['[%s "%s"]' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+             for name, value in tags.items()]
+    lines.append("")
+    #move numbers carry on from the starting position
+    fields = start_fen.split()
+    number = int(fields[5])
+    white_to_move = fields[1] == 'w'
+    tokens = []
+    for i, san in enumerate(sans):
+        if white_to_move:
+            tokens.append("%d. %s" % (number, san))
+        elif i == 0:
+            tokens.append("%d... %s" % (number, san))
+        else:
+            tokens.append(san)
+        if not white_to_move:
+            number += 1
+        white_to_move = not white_to_move
+    tokens.append(headers["Result"])
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def write_game(stream, gs, headers=None):
+    """Append the game played on gs to an open text stream as PGN"""
+    stream.write(game_to_pgn(gs, headers))
+
+
+if __name__ == "__main__":
+    games = plies = 0
+    with open(sys.argv[1], encoding="utf-8", errors="replace") as pgn_file:
+        for game, gs in replay_games(pgn_file):
+            games += 1
+            plies += len(game.moves)
+    print("%d games, %d plies" % (games, plies))
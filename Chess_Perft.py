@@ -0,0 +1,125 @@
+"""Perft: counts the leaf nodes of the move generation tree to a fixed depth.
+Used as a correctness check against published node counts and as a speed baseline
+for get_valid_moves, make_move and undoMove.
+Run directly: python Chess_Perft.py [--depth N] [--fen FEN] [--divide] [--bitboard] [--verify]
+"""
+
+import argparse
+import time
+import Chess_Engine
+import Chess_Evaluation
+import Chess_Bitboard
+
+START_FEN = Chess_Engine.START_FEN
+
+#(name, fen, node counts for depth 1, 2, 3...) from the Chess Programming Wiki perft results
+SUITE = [
+    ("start", START_FEN, [20, 400, 8902, 197281]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def load_fen(fen, backend=Chess_Engine.GameState):
+    """A new GameState of the given backend set to the position in fen"""
+    return backend.from_fen(fen)
+
+
+def snapshot(gs):
+    """Everything make_move/undoMove must restore, for the verify mode"""
+    rights = gs.current_castling_right
+    return ([row[:] for row in gs.board], gs.whiteToMove, gs.enpassent_possible,
+            (rights.wks, rights.bks, rights.wqs, rights.bqs), gs.white_king_location, gs.black_king_location,
+            gs.zobrist_key, gs.middlegame_score, gs.endgame_score, gs.game_phase, gs.halfmove_clock,
+            gs.fullmove_number)
+
+
+def perft(gs, depth, verify=False):
+    """Number of leaf nodes depth plies below gs. With verify, also checks that undoMove
+    restores the position exactly after every move and that the incremental zobrist key
+    and evaluation terms match ones computed from scratch"""
+    moves = gs.get_valid_moves()
+    if depth == 1 and not verify:
+        return len(moves)
+    before = snapshot(gs) if verify else None
+    nodes = 0
+    for move in moves:
+        gs.make_move(move)
+        if verify and gs.zobrist_key != gs.compute_zobrist_key():
+            raise AssertionError("Incremental zobrist key wrong after " + move.get_chess_notation())
+        if verify and (gs.middlegame_score, gs.endgame_score, gs.game_phase) != Chess_Evaluation.compute_terms(gs.board):
+            raise AssertionError("Incremental evaluation wrong after " + move.get_chess_notation())
+        nodes += perft(gs, depth - 1, verify) if depth > 1 else 1
+        gs.undoMove()
+        if verify and snapshot(gs) != before:
+            raise AssertionError("undoMove did not restore the position after " + move.get_chess_notation())
+    return nodes
+
+
+def divide(gs, depth, verify=False):
+    """Leaf node count below each root move, keyed by the move's coordinate notation"""
+    counts = {}
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        counts[move.get_chess_notation()] = perft(gs, depth - 1, verify) if depth > 1 else 1
+        gs.undoMove()
+    return counts
+
+
+def timed_perft(gs, depth, verify=False):
+    """(nodes, seconds, nodes per second) for a perft of gs to depth"""
+    start = time.perf_counter()
+    nodes = perft(gs, depth, verify)
+    seconds = time.perf_counter() - start
+    return nodes, seconds, nodes / seconds if seconds > 0 else 0.0
+
+
+def run_suite(max_depth=3, backend=Chess_Engine.GameState, verify=False):
+    """Run every suite position up to max_depth, printing counts and speed.
+    Returns True if every count matched"""
+    passed = True
+    total_nodes = 0
+    total_seconds = 0.0
+    for name, fen, counts in SUITE:
+        for depth, expected in enumerate(counts[:max_depth], 1):
+            nodes, seconds, nps = timed_perft(load_fen(fen, backend), depth, verify)
+            total_nodes += nodes
+            total_seconds += seconds
+            status = "ok" if nodes == expected else "FAIL expected %d" % expected
+            passed = passed and nodes == expected
+            print("%-12s depth %d %10d nodes %8.2fs %10.0f nps  %s" % (name, depth, nodes, seconds, nps, status))
+    if total_seconds > 0:
+        print("total %d nodes in %.2fs, %.0f nps" % (total_nodes, total_seconds, total_nodes / total_seconds))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft node counts for Chess_Engine")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fen", help="count a single position instead of the suite")
+    parser.add_argument("--divide", action="store_true", help="print the count below every root move")
+    parser.add_argument("--bitboard", action="store_true", help="use the bitboard backend")
+    parser.add_argument("--verify", action="store_true", help="check undoMove restores every position")
+    args = parser.parse_args()
+    backend = Chess_Bitboard.BitboardGameState if args.bitboard else Chess_Engine.GameState
+    if args.fen is None:
+        raise SystemExit(0 if run_suite(args.depth, backend, args.verify) else 1)
+    gs = load_fen(args.fen, backend)
+    if args.divide:
+        counts = divide(gs, args.depth, args.verify)
+        for notation in sorted(counts):
+            print(notation, counts[notation])
+        print("total", sum(counts.values()))
+    else:
+        nodes, seconds, nps = timed_perft(gs, args.depth, args.verify)
+        print("%d nodes in %.2fs, %.0f nps" % (nodes, seconds, nps))
+
+
+if __name__ == "__main__":
+    main()
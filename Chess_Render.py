@@ -0,0 +1,300 @@
+"""Headless board rendering, for exporting positions and whole games as images in bulk.
+Boards are drawn on off-screen pygame surfaces. When no window is open the SDL dummy video driver
+is used, so this runs on a server without a display. The piece images come scaled from Chess_Assets
+and the empty board of each size is cached, so after the first board of a size drawing one is a single
+copy of the background and a blit per piece.
+PNG files are written by pygame. Animated GIFs need Pillow, which is optional.
+export runs on a pool of worker processes in the same way as Chess_Batch.analyse.
+Run directly: python Chess_Render.py (--fens FILE | --pgn FILE) --out DIR [--size N] [--frames | --gif]
+              [--workers N] [--chunk N] [--frame-ms N] [--unordered]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pygame as p
+import Chess_Engine
+import Chess_PGN
+import Chess_Batch
+import Chess_Assets
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None #no GIF export
+
+DIMENSION = 8
+DEFAULT_SIZE = 512 #width and height of a board in pixels, as in Chess_Main
+THUMBNAIL_SIZE = 128
+FRAME_MS = 500 #how long each move is shown in a GIF
+SQUARE_COLORS = ("white", "grey") #light and dark squares, as in Chess_Main
+LAST_MOVE_COLOR = "bisque2"
+LAST_MOVE_ALPHA = 100
+
+_backgrounds = {} #square size -> empty board
+_tints = {} #square size -> translucent square laid over the squares of the last move
+_gif_palettes = {} #square size -> Pillow image with the palette GIF frames are mapped onto
+
+#Set in every worker process by _init_worker
+_gs = None
+_options = None
+
+
+class RenderedItem():
+    def __init__(self, name, paths, error=None):
+        self.name = name
+        self.paths = paths #files written
+        self.error = error #message if the position or game could not be rendered
+
+    def __str__(self):
+        if self.error is not None:
+            return "%s error %s" % (self.name, self.error)
+        if len(self.paths) == 1:
+            return "%s %s" % (self.name, self.paths[0])
+        return "%s %d images" % (self.name, len(self.paths))
+
+
+def init():
+    """Make sure pygame can draw and convert images. Without a window already open, the dummy video
+    driver gives a 1x1 off-screen display, which is all convert_alpha needs"""
+    if p.display.get_surface() is None:
+        if not p.display.get_init():
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            p.display.init()
+        p.display.set_mode((1, 1))
+
+
+def clear_caches():
+    """Forget every loaded image, scaled image and board, so the next board is drawn from the files"""
+    Chess_Assets.clear()
+    _backgrounds.clear()
+    _tints.clear()
+    _gif_palettes.clear()
+
+
+def piece_images(square_size):
+    """{piece: image} smoothly scaled to square_size pixels, which keeps small thumbnails legible"""
+    init()
+    return Chess_Assets.piece_images(square_size, True)
+
+
+def board_background(square_size):
+    """The empty board with squares of square_size pixels, drawn once for each size"""
+    background = _backgrounds.get(square_size)
+    if background is None:
+        init()
+        background = p.Surface((square_size * DIMENSION, square_size * DIMENSION)).convert()
+        colors = [p.Color(color) for color in SQUARE_COLORS]
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                background.fill(colors[(row + col) % 2],
+                                p.Rect(col * square_size, row * square_size, square_size, square_size))
+        _backgrounds[square_size] = background
+    return background
+
+
+def _last_move_tint(square_size):
+    tint = _tints.get(square_size)
+    if tint is None:
+        tint = p.Surface((square_size, square_size)).convert()
+        tint.fill(p.Color(LAST_MOVE_COLOR))
+        tint.set_alpha(LAST_MOVE_ALPHA)
+        _tints[square_size] = tint
+    return tint
+
+
+def render_board(board, size=DEFAULT_SIZE, last_move=None, surface=None):
+    """board, a GameState.board, drawn size pixels wide with the squares of last_move tinted.
+    It is drawn on surface if given, which has to be the same size, otherwise on a new surface"""
+    square_size = size // DIMENSION
+    background = board_background(square_size)
+    if surface is None:
+        surface = background.copy()
+    else:
+        surface.blit(background, (0, 0))
+    if last_move is not None:
+        tint = _last_move_tint(square_size)
+        surface.blit(tint, (last_move.start_col * square_size, last_move.start_row * square_size))
+        surface.blit(tint, (last_move.end_col * square_size, last_move.end_row * square_size))
+    images = piece_images(square_size)
+    surface.blits([(images[piece], (col * square_size, row * square_size))
+                   for row, pieces in enumerate(board) for col, piece in enumerate(pieces) if piece != "--"],
+                  doreturn=False)
+    return surface
+
+
+def render_fen(fen, size=DEFAULT_SIZE, gs=None):
+    """The position fen drawn size pixels wide, loaded into gs if given"""
+    if gs is None:
+        gs = Chess_Engine.GameState.from_fen(fen)
+    else:
+        gs.load_fen(fen)
+    return render_board(gs.board, size)
+
+
+def game_frames(game, size=DEFAULT_SIZE, gs=None):
+    """Yield the board of game, a PGNGame, before the first move and after every move with the move
+    just played tinted. The game is played on gs if given. The same surface is drawn over for every
+    frame, so save or copy it before asking for the next"""
+    if gs is None:
+        gs = Chess_Engine.GameState.from_fen(game.start_fen())
+    else:
+        gs.load_fen(game.start_fen())
+    surface = render_board(gs.board, size)
+    yield surface
+    for san in game.moves:
+        move = Chess_PGN.parse_san(gs, san)
+        gs.make_move(move)
+        yield render_board(gs.board, size, move, surface)
+
+
+def final_position(game, gs=None):
+    """(board, last move) at the end of game, played on gs if given"""
+    gs = game.replay(gs)
+    return gs.board, gs.movelog[-1] if gs.movelog else None
+
+
+def save_png(surface, path):
+    p.image.save(surface, path)
+
+
+def _to_image(surface):
+    return Image.frombytes("RGB", surface.get_size(), p.image.tobytes(surface, "RGB"))
+
+
+def _gif_palette(square_size):
+    """A palette image for GIF frames of square_size: the starting position, which has every piece,
+    with the last move tint over light and dark squares both with and without pieces on them"""
+    palette = _gif_palettes.get(square_size)
+    if palette is None:
+        surface = render_board(Chess_Engine.GameState.from_fen(Chess_Engine.START_FEN).board,
+                               square_size * DIMENSION)
+        tint = _last_move_tint(square_size)
+        for row, col in ((0, 3), (0, 4), (3, 3), (3, 4), (6, 3), (6, 4), (7, 3), (7, 4)):
+            surface.blit(tint, (col * square_size, row * square_size))
+        palette = _gif_palettes[square_size] = _to_image(surface).quantize()
+    return palette
+
+
+def save_gif(frames, path, frame_ms=FRAME_MS):
+    """Write the surfaces from frames, an iterable such as game_frames, as an animated GIF showing
+    each for frame_ms milliseconds. Needs Pillow.
+    Every frame is mapped onto one palette made for the board size, instead of Pillow working out
+    a palette for each frame, and Pillow's frame optimisation is skipped: between them these make
+    writing a game about ten times faster"""
+    if Image is None:
+        raise RuntimeError("Writing GIFs needs Pillow (pip install Pillow)")
+    images = []
+    for surface in frames:
+        palette = _gif_palette(surface.get_width() // DIMENSION)
+        images.append(_to_image(surface).quantize(palette=palette, dither=Image.Dither.NONE))
+    images[0].save(path, save_all=True, append_images=images[1:], duration=frame_ms, loop=0, optimize=False)
+
+
+def _init_worker(out_dir, size, frame_ms):
+    global _gs, _options
+    init()
+    _gs = Chess_Engine.GameState()
+    _options = (out_dir, size, frame_ms)
+
+
+def export_position(item):
+    """Save (name, FEN) as name.png in the worker process"""
+    name, fen = item
+    out_dir, size, _ = _options
+    path = os.path.join(out_dir, name + ".png")
+    try:
+        save_png(render_fen(fen, size, _gs), path)
+    except Exception as error:
+        return RenderedItem(name, [], Chess_Batch.error_text(error))
+    return RenderedItem(name, [path])
+
+
+def export_thumbnail(item):
+    """Save the final position of (name, PGNGame) as name.png in the worker process"""
+    name, game = item
+    out_dir, size, _ = _options
+    path = os.path.join(out_dir, name + ".png")
+    try:
+        board, last_move = final_position(game, _gs)
+    except Exception as error:
+        return RenderedItem(name, [], Chess_Batch.error_text(error))
+    save_png(render_board(board, size, last_move), path)
+    return RenderedItem(name, [path])
+
+
+def export_frames(item):
+    """Save every position of (name, PGNGame) as name_000.png, name_001.png, ... in the worker process"""
+    name, game = item
+    out_dir, size, _ = _options
+    paths = []
+    try:
+        for number, surface in enumerate(game_frames(game, size, _gs)):
+            paths.append(os.path.join(out_dir, "%s_%03d.png" % (name, number)))
+            save_png(surface, paths[-1])
+    except Exception as error:
+        return RenderedItem(name, paths, Chess_Batch.error_text(error))
+    return RenderedItem(name, paths)
+
+
+def export_gif(item):
+    """Save (name, PGNGame) as the animated name.gif in the worker process"""
+    name, game = item
+    out_dir, size, frame_ms = _options
+    path = os.path.join(out_dir, name + ".gif")
+    try:
+        save_gif(game_frames(game, size, _gs), path, frame_ms)
+    except Exception as error:
+        return RenderedItem(name, [], Chess_Batch.error_text(error))
+    return RenderedItem(name, [path])
+
+
+def export(items, function=export_thumbnail, out_dir=".", size=THUMBNAIL_SIZE, workers=None,
+           chunk_size=Chess_Batch.DEFAULT_CHUNK, ordered=True, frame_ms=FRAME_MS):
+    """Yield a RenderedItem for every item, drawn and saved in out_dir by a pool of worker processes.
+    function is export_position for FEN strings, or export_thumbnail, export_frames or export_gif for
+    PGNGames. Files are named after the position of the item in items: 000000.png, 000001.png, ...
+    items may be a generator over a file of any size, as in Chess_Batch.analyse"""
+    if function is export_gif and Image is None:
+        raise RuntimeError("Writing GIFs needs Pillow (pip install Pillow)")
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    named = (("%06d" % number, item) for number, item in enumerate(items))
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(out_dir, size, frame_ms)) as executor:
+        yield from Chess_Batch.map_chunks(executor, workers, function, named, chunk_size, ordered)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render positions or games to image files on every core")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--fens", help="file with one FEN per line")
+    source.add_argument("--pgn", help="PGN file of games, rendered as a thumbnail of the final position")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--frames", action="store_true", help="a PNG of every position of each game")
+    output.add_argument("--gif", action="store_true", help="an animated GIF of each game, needs Pillow")
+    parser.add_argument("--out", required=True, help="directory for the images")
+    parser.add_argument("--size", type=int, default=None, help="board width in pixels, default %d or %d for "
+                                                              "thumbnails" % (DEFAULT_SIZE, THUMBNAIL_SIZE))
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, default one per core")
+    parser.add_argument("--chunk", type=int, default=Chess_Batch.DEFAULT_CHUNK, help="items sent to a worker at once")
+    parser.add_argument("--frame-ms", type=int, default=FRAME_MS, help="milliseconds per move in a GIF")
+    parser.add_argument("--unordered", action="store_true", help="print results as soon as they are ready")
+    args = parser.parse_args()
+    if args.fens:
+        function = export_position
+    else:
+        function = export_gif if args.gif else export_frames if args.frames else export_thumbnail
+    size = args.size or (THUMBNAIL_SIZE if function is export_thumbnail else DEFAULT_SIZE)
+    start = time.perf_counter()
+    count = 0
+    with open(args.fens or args.pgn, encoding="utf-8", errors="replace") as input_file:
+        items = Chess_Batch.read_fens(input_file) if args.fens else Chess_PGN.read_games(input_file)
+        for result in export(items, function, args.out, size, args.workers, args.chunk, not args.unordered,
+                             args.frame_ms):
+            print(result)
+            count += len(result.paths)
+    seconds = time.perf_counter() - start
+    print("%d images in %.2fs, %.1f/s" % (count, seconds, count / seconds if seconds > 0 else 0.0),
+          file=sys.stderr)
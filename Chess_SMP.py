@@ -0,0 +1,129 @@
+"""Lazy SMP: a parallel search in which several worker processes search the same root position
+and share one transposition table kept in multiprocessing.shared_memory. The workers do not
+split the tree between them; they help each other through the table, with every other helper
+starting one ply deeper so the workers are spread over neighbouring depths.
+Each worker reports every iteration it completes and the deepest one wins.
+"""
+
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+import Chess_Engine
+import Chess_Search
+import Chess_Transposition
+
+DEFAULT_WORKERS = 4
+RESULT_POLL_SECONDS = 0.05 #how often the main process checks the clock while waiting for results
+
+
+'''
+(FEN the game started from, move_IDs of the moves played) so a worker can rebuild the whole game,
+not just the current position. gs ends up where it was
+'''
+def game_history(gs):
+    return gs.start_fen(), [move.move_ID for move in gs.movelog]
+
+
+def _worker(number, shm_name, tt_mb, backend, start_fen, move_IDs, max_depth, time_limit, stop_event, results):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    tt = Chess_Transposition.TranspositionTable(tt_mb, shm.buf)
+    try:
+        gs = backend.from_fen(start_fen)
+        for move_ID in move_IDs:
+            gs.make_move(Chess_Engine.Move.from_move_ID(move_ID, gs.board))
+        searcher = Chess_Search.Searcher(tt)
+        searcher.stop_event = stop_event
+
+        def report(result):
+            results.put(("iteration", number, result.depth, result.score,
+                         [move.move_ID for move in result.pv], searcher.nodes, searcher.qnodes))
+
+        #helpers with an odd number start a ply deeper than the rest
+        searcher.search(gs, max_depth, time_limit, on_iteration=report, start_depth=1 + number % 2)
+        results.put(("done", number, searcher.nodes, searcher.qnodes))
+    finally:
+        tt.release()
+        shm.close()
+
+
+class ParallelSearcher():
+    def __init__(self, workers=DEFAULT_WORKERS, tt_mb=Chess_Search.DEFAULT_TT_MB):
+        self.workers = workers
+        self.tt_mb = tt_mb
+        self.nodes = 0 #total over all workers in the last search
+        self.worker_nodes = [] #nodes searched by each worker in the last search
+        self.worker_qnodes = []
+
+    '''
+    Search gs with self.workers processes until one of them completes max_depth or time_limit
+    seconds pass, and return a SearchResult for the deepest iteration any worker completed.
+    Its node count and speed are totals over every worker. gs is not changed
+    '''
+    def search(self, gs, max_depth=64, time_limit=None):
+        start = time.perf_counter()
+        check_mate, stale_mate = gs.check_mate, gs.stale_mate
+        root_moves = gs.get_valid_moves()
+        gs.check_mate, gs.stale_mate = check_mate, stale_mate
+        if not root_moves:
+            return None
+        start_fen, move_IDs = game_history(gs)
+        context = multiprocessing.get_context()
+        shm = shared_memory.SharedMemory(create=True, size=Chess_Transposition.table_bytes(self.tt_mb))
+        stop_event = context.Event()
+        results = context.Queue()
+        processes = [context.Process(target=_worker, daemon=True,
+                                     args=(number, shm.name, self.tt_mb, type(gs), start_fen, move_IDs, max_depth,
+                                           time_limit, stop_event, results))
+                     for number in range(self.workers)]
+        best = None #(depth, score, pv move_IDs)
+        self.worker_nodes = [0] * self.workers
+        self.worker_qnodes = [0] * self.workers
+        try:
+            for process in processes:
+                process.start()
+            running = self.workers
+            deadline = start + time_limit if time_limit is not None else None
+            while running:
+                try:
+                    message = results.get(timeout=RESULT_POLL_SECONDS)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        raise RuntimeError("Search worker stopped without reporting")
+                    message = None
+                if message is not None:
+                    if message[0] == "done":
+                        running -= 1
+                        _, number, self.worker_nodes[number], self.worker_qnodes[number] = message
+                    else:
+                        _, number, depth, score, pv, self.worker_nodes[number], self.worker_qnodes[number] = message
+                        if best is None or depth > best[0]:
+                            best = (depth, score, pv)
+                        if depth >= max_depth or abs(score) > Chess_Search.MATE_BOUND:
+                            stop_event.set()
+                if deadline is not None and time.perf_counter() >= deadline:
+                    stop_event.set()
+            for process in processes:
+                process.join()
+        finally:
+            stop_event.set()
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            shm.close()
+            shm.unlink()
+        seconds = time.perf_counter() - start
+        self.nodes = sum(self.worker_nodes)
+        qnodes = sum(self.worker_qnodes)
+        if best is None: #stopped before any worker finished an iteration
+            return Chess_Search.SearchResult(root_moves[0], 0, 0, [root_moves[0]], self.nodes, qnodes, seconds, 0.0)
+        depth, score, pv_IDs = best
+        pv = []
+        for move_ID in pv_IDs: #rebuild the principal variation as moves on gs
+            move = Chess_Engine.Move.from_move_ID(move_ID, gs.board)
+            pv.append(move)
+            gs.make_move(move)
+        for _ in pv:
+            gs.undoMove()
+        return Chess_Search.SearchResult(pv[0], score, depth, pv, self.nodes, qnodes, seconds, 0.0)
@@ -0,0 +1,263 @@
+"""Computer opponent: negamax alpha-beta search with iterative deepening on top of GameState.
+Uses only get_valid_moves, make_move and undoMove, so it works with either backend.
+"""
+
+import time
+import Chess_Transposition
+import Chess_Ordering
+import Chess_Evaluation
+
+CHECKMATE = 100000 #score of being mated at the root, mates further away score closer to zero
+MATE_BOUND = CHECKMATE - 1000 #scores beyond this are mates
+STALEMATE = 0
+DEFAULT_TT_MB = 16
+DELTA_MARGIN = 200 #a capture that cannot raise the score to alpha even with this bonus is skipped
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time or node budget runs out"""
+
+
+class SearchResult():
+    def __init__(self, best_move, score, depth, pv, nodes, qnodes, seconds, branching_factor):
+        self.best_move = best_move
+        self.score = score #centipawns for the side to move
+        self.depth = depth #deepest completed iteration
+        self.pv = pv #principal variation, a list of moves starting with best_move
+        self.nodes = nodes #all nodes, including the quiescence nodes
+        self.qnodes = qnodes #nodes searched by the quiescence search
+        self.seconds = seconds
+        self.nps = nodes / seconds if seconds > 0 else 0.0
+        self.branching_factor = branching_factor #effective branching factor of the last iteration
+
+    def __str__(self):
+        return "depth %d score %d nodes %d qnodes %d nps %.0f ebf %.2f pv %s" % (
+            self.depth, self.score, self.nodes, self.qnodes, self.nps, self.branching_factor,
+            " ".join(move.get_chess_notation() for move in self.pv))
+
+
+'''
+Mate scores are stored in the transposition table relative to the node instead of the root,
+so they stay correct when the same position is reached at a different ply
+'''
+def score_to_tt(score, ply):
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+'''
+Move the move with the given move_ID, if there is one, to the front of moves
+'''
+def move_to_front(moves, move_ID):
+    for i, move in enumerate(moves):
+        if move.move_ID == move_ID:
+            if i:
+                moves.insert(0, moves.pop(i))
+            return
+
+
+class Searcher():
+    def __init__(self, tt=None, use_ordering=True):
+        self.tt = tt if tt is not None else Chess_Transposition.TranspositionTable(DEFAULT_TT_MB)
+        self.orderer = Chess_Ordering.MoveOrderer() if use_ordering else None #None keeps board scan order
+        self.nodes = 0
+        self.qnodes = 0
+        self.stop_time = None
+        self.node_limit = None
+        self.stop_event = None #an Event another thread or process can set to stop the search
+
+    '''
+    Search gs with iterative deepening from start_depth up to max_depth, stopping early when time_limit
+    seconds or node_limit nodes run out or stop_event is set. The result of the deepest completed
+    iteration is returned, and on_iteration, if given, is called with the SearchResult of every
+    completed iteration
+    '''
+    def search(self, gs, max_depth=64, time_limit=None, node_limit=None, on_iteration=None, start_depth=1):
+        start = time.perf_counter()
+        self.nodes = 0
+        self.qnodes = 0
+        self.stop_time = start + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+        check_mate, stale_mate = gs.check_mate, gs.stale_mate #the search overwrites these at every node
+        self.tt.new_search()
+        root_moves = gs.get_valid_moves()
+        if self.orderer is not None:
+            self.orderer.new_search()
+            root_moves.sort(key=Chess_Ordering.mvv_lva, reverse=True)
+        #nodes are rarely seen twice outside the table, the cache would only slow every node down
+        #and push out the positions the game itself keeps going back to
+        move_cache, gs.move_cache = gs.move_cache, None
+        try:
+            result = None
+            if root_moves:
+                result = SearchResult(root_moves[0], 0, 0, [root_moves[0]], 0, 0, 0.0, 0.0)
+                previous_nodes = 0
+                for depth in range(start_depth, max_depth + 1):
+                    iteration_start_nodes = self.nodes
+                    try:
+                        score, pv = self.search_root(gs, root_moves, depth)
+                    except SearchTimeout:
+                        break
+                    iteration_nodes = self.nodes - iteration_start_nodes
+                    branching_factor = iteration_nodes / previous_nodes if previous_nodes else 0.0
+                    previous_nodes = iteration_nodes
+                    result = SearchResult(pv[0], score, depth, pv, self.nodes, self.qnodes,
+                                          time.perf_counter() - start, branching_factor)
+                    if on_iteration is not None:
+                        on_iteration(result)
+                    #search the best move first in the next iteration
+                    root_moves.remove(pv[0])
+                    root_moves.insert(0, pv[0])
+                    if abs(score) > MATE_BOUND: #found a forced mate, deeper searches will not change it
+                        break
+                result.nodes = self.nodes
+                result.qnodes = self.qnodes
+                result.seconds = time.perf_counter() - start
+                result.nps = result.nodes / result.seconds if result.seconds > 0 else 0.0
+        finally: #the caller's game state gets its flags and cache back however the search ends
+            gs.check_mate, gs.stale_mate = check_mate, stale_mate
+            gs.move_cache = move_cache
+        return result
+
+    def search_root(self, gs, moves, depth):
+        alpha, beta = -CHECKMATE - 1, CHECKMATE + 1
+        best_pv = []
+        for move in moves:
+            gs.make_move(move)
+            try:
+                score, pv = self.negamax(gs, depth - 1, -beta, -alpha, 1)
+            finally:
+                gs.undoMove()
+            score = -score
+            if score > alpha:
+                alpha = score
+                best_pv = [move] + pv
+        self.tt.store(gs.zobrist_key, depth, score_to_tt(alpha, 0), Chess_Transposition.EXACT, best_pv[0].move_ID)
+        return alpha, best_pv
+
+    '''
+    Score of gs for the side to move searched depth plies deep, with the principal variation below it
+    '''
+    def negamax(self, gs, depth, alpha, beta, ply):
+        if depth == 0:
+            return self.quiescence(gs, alpha, beta, ply), []
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_budget()
+        #a position repeated anywhere on the path is scored as the draw it can be turned into
+        if gs.halfmove_clock >= 4 and gs.is_repetition(2) or gs.insufficient_material():
+            return STALEMATE, []
+        entry = self.tt.probe(gs.zobrist_key)
+        tt_move_ID = None
+        if entry is not None:
+            tt_depth, tt_score, tt_bound, tt_move_ID = entry
+            if tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if tt_bound == Chess_Transposition.EXACT or \
+                        (tt_bound == Chess_Transposition.LOWER_BOUND and tt_score >= beta) or \
+                        (tt_bound == Chess_Transposition.UPPER_BOUND and tt_score <= alpha):
+                    return tt_score, []
+        moves = gs.get_valid_moves()
+        if not moves:
+            return (-CHECKMATE + ply if gs.check_mate else STALEMATE), []
+        if gs.halfmove_clock >= 100:
+            return STALEMATE, []
+        if self.orderer is not None:
+            moves = self.orderer.ordered_moves(moves, ply, tt_move_ID)
+        elif tt_move_ID is not None:
+            move_to_front(moves, tt_move_ID)
+        alpha_original = alpha
+        best_score = -CHECKMATE - 1
+        best_move = None
+        best_pv = []
+        for move in moves:
+            gs.make_move(move)
+            try:
+                score, pv = self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                gs.undoMove()
+            score = -score
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    best_pv = [move] + pv
+                    if score >= beta:
+                        if self.orderer is not None:
+                            self.orderer.record_cutoff(move, depth, ply)
+                        break
+        if best_score >= beta:
+            bound = Chess_Transposition.LOWER_BOUND
+        elif best_score > alpha_original:
+            bound = Chess_Transposition.EXACT
+        else:
+            bound = Chess_Transposition.UPPER_BOUND
+        self.tt.store(gs.zobrist_key, depth, score_to_tt(best_score, ply), bound, best_move.move_ID)
+        return best_score, (best_pv if bound == Chess_Transposition.EXACT else [])
+
+    '''
+    Search only captures and promotions until the position is quiet, so the score is not taken in
+    the middle of an exchange. The side to move may stand pat on the static evaluation unless in check
+    '''
+    def quiescence(self, gs, alpha, beta, ply):
+        self.nodes += 1
+        self.qnodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_budget()
+        moves = gs.get_valid_moves()
+        if not moves:
+            return -CHECKMATE + ply if gs.check_mate else STALEMATE
+        if gs.in_check: #every evasion has to be searched, there is no standing pat
+            best_score = -CHECKMATE - 1
+            stand_pat = None
+        else:
+            stand_pat = best_score = Chess_Evaluation.evaluate(gs)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            #captures and queen promotions, underpromotions only matter in the full width search
+            moves = [move for move in moves if move.promotion_piece == 'Q' or
+                     (move.place_captured != "--" and move.promotion_piece is None)]
+            moves.sort(key=Chess_Ordering.mvv_lva, reverse=True)
+        for move in moves:
+            if stand_pat is not None:
+                #delta pruning: even winning the piece outright would not get back to alpha
+                if not move.is_pawn_promotion and \
+                        stand_pat + Chess_Evaluation.see_values[move.place_captured[1]] + DELTA_MARGIN <= alpha:
+                    continue
+                #captures that lose material once all recaptures are played out
+                if Chess_Evaluation.static_exchange(gs, move) < 0:
+                    continue
+            gs.make_move(move)
+            try:
+                score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            finally:
+                gs.undoMove()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best_score
+
+    def check_budget(self):
+        if self.stop_time is not None and time.perf_counter() >= self.stop_time:
+            raise SearchTimeout()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchTimeout()
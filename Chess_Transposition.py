@@ -0,0 +1,144 @@
+"""Fixed size transposition table keyed by GameState.zobrist_key.
+Entries live in one flat array of unsigned 64 bit ints so the memory used never grows past
+the size asked for. Every bucket holds two entries: a depth-preferred slot that keeps the
+deepest result of the current search, and an always-replace slot that takes everything else.
+Each entry is two ints, the zobrist key XORed with the packed data, and the packed data.
+The XOR means an entry half written by another process sharing the table (Chess_SMP) does
+not match its key and is treated as a miss instead of returning another position's data.
+The packed data is:
+    bits 0-15   best move_ID
+    bits 16-23  depth
+    bits 24-25  bound type
+    bits 26-31  age of the search that stored it
+    bits 32-63  score + SCORE_OFFSET
+"""
+
+from array import array
+
+EXACT = 0
+LOWER_BOUND = 1 #the score is at least this (the search failed high)
+UPPER_BOUND = 2 #the score is at most this (the search failed low)
+
+NO_MOVE = 0xFFFF
+SCORE_OFFSET = 1 << 31
+SLOT_BYTES = 16 #key and data
+BUCKET_SLOTS = 2
+AGE_MASK = 63
+FILL_SAMPLE_BUCKETS = 1000
+
+
+def bucket_count(size_mb):
+    """Largest power of two number of buckets that fits in size_mb"""
+    buckets = 1
+    while buckets * 2 * BUCKET_SLOTS * SLOT_BYTES <= size_mb * 1024 * 1024:
+        buckets *= 2
+    return buckets
+
+
+def table_bytes(size_mb):
+    """Bytes taken by a table of size_mb, for allocating a buffer to hold it"""
+    return bucket_count(size_mb) * BUCKET_SLOTS * SLOT_BYTES
+
+
+class TranspositionTable():
+    '''
+    buffer, if given, is writable memory of at least table_bytes(size_mb) bytes to keep the entries in,
+    such as a multiprocessing.shared_memory block. Otherwise the table gets its own array
+    '''
+    def __init__(self, size_mb=16, buffer=None):
+        buckets = bucket_count(size_mb)
+        self.bucket_mask = buckets - 1
+        if buffer is None:
+            self.table = array('Q', bytes(buckets * BUCKET_SLOTS * SLOT_BYTES))
+        else:
+            self.table = memoryview(buffer)[:buckets * BUCKET_SLOTS * SLOT_BYTES].cast('Q')
+        self.age = 0
+        self.reset_stats()
+
+    '''
+    Bytes used by the table itself
+    '''
+    def memory_bytes(self):
+        return len(self.table) * self.table.itemsize
+
+    def clear(self):
+        if isinstance(self.table, memoryview): #zero the shared buffer in place
+            self.table[:] = array('Q', bytes(len(self.table) * self.table.itemsize))
+        else:
+            self.table = array('Q', bytes(len(self.table) * self.table.itemsize))
+        self.age = 0
+        self.reset_stats()
+
+    '''
+    Let go of a buffer passed to the constructor so its owner can close it. The table cannot be used afterwards
+    '''
+    def release(self):
+        if isinstance(self.table, memoryview):
+            self.table.release()
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0 #probes that found the bucket holding other positions
+        self.stores = 0
+        self.overwrites = 0 #stores that replaced an entry for a different position
+
+    '''
+    Start a new search: entries from earlier searches become the first to be replaced
+    '''
+    def new_search(self):
+        self.age = (self.age + 1) & AGE_MASK
+
+    '''
+    Returns (depth, score, bound, move_ID) stored for key, or None. move_ID is None when no move was stored
+    '''
+    def probe(self, key):
+        self.probes += 1
+        table = self.table
+        index = (key & self.bucket_mask) * BUCKET_SLOTS * 2
+        occupied = False
+        for slot in range(index, index + BUCKET_SLOTS * 2, 2):
+            data = table[slot + 1]
+            if data:
+                if table[slot] ^ data == key:
+                    self.hits += 1
+                    move_ID = data & 0xFFFF
+                    return (data >> 16 & 0xFF, (data >> 32) - SCORE_OFFSET, data >> 24 & 3,
+                            None if move_ID == NO_MOVE else move_ID)
+                occupied = True
+        if occupied:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, bound, move_ID=None):
+        self.stores += 1
+        table = self.table
+        index = (key & self.bucket_mask) * BUCKET_SLOTS * 2
+        data = (NO_MOVE if move_ID is None else move_ID) | depth << 16 | bound << 24 | self.age << 26 | \
+            (score + SCORE_OFFSET) << 32
+        #depth-preferred slot: take it if it is empty, the same position, from an old search or not deeper
+        old_data = table[index + 1]
+        if not old_data or table[index] ^ old_data == key or (old_data >> 26 & AGE_MASK) != self.age or \
+                depth >= (old_data >> 16 & 0xFF):
+            slot = index
+        else:
+            slot = index + 2 #always-replace slot
+            old_data = table[slot + 1]
+        if old_data and table[slot] ^ old_data != key:
+            self.overwrites += 1
+        table[slot] = key ^ data
+        table[slot + 1] = data
+
+    '''
+    Permille of slots in use, sampled from the first buckets like a UCI hashfull
+    '''
+    def hashfull(self):
+        buckets = min(FILL_SAMPLE_BUCKETS, self.bucket_mask + 1)
+        used = sum(1 for slot in range(1, buckets * BUCKET_SLOTS * 2, 2) if self.table[slot])
+        return used * 1000 // (buckets * BUCKET_SLOTS)
+
+    def stats(self):
+        hit_rate = self.hits / self.probes if self.probes else 0.0
+        return "tt %.1fMB probes %d hits %d (%.1f%%) collisions %d stores %d overwrites %d full %d/1000" % (
+            self.memory_bytes() / (1024 * 1024), self.probes, self.hits, hit_rate * 100, self.collisions,
+            self.stores, self.overwrites, self.hashfull())
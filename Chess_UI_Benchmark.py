@@ -0,0 +1,155 @@
+"""Benchmarks for the window and the images: drawing boards, the piece and text caches and the worker
+process that keeps the window responsive. Kept apart from Chess_Benchmark, which needs no pygame.
+Run directly: python Chess_UI_Benchmark.py
+"""
+
+import io
+import os
+import random
+import tempfile
+import time
+import pygame as p
+import Chess_Engine
+import Chess_Search
+import Chess_PGN
+import Chess_Render
+import Chess_Assets
+import Chess_Background
+import Chess_Benchmark
+
+
+def bench_render(count=300, games=200, max_plies=120, worker_counts=(1, 2, 4), seed=4):
+    """Thumbnails per second drawn by Chess_Render with the image caches cleared before every board
+    against kept, then written as PNG files for an archive of random games on each number of workers"""
+    Chess_Render.init()
+    size = Chess_Render.THUMBNAIL_SIZE
+    boards = [Chess_Engine.GameState.from_fen(fen).board for fen in Chess_Benchmark.random_fens(count, seed=seed)]
+    start = time.perf_counter()
+    for board in boards:
+        Chess_Render.clear_caches()
+        Chess_Render.render_board(board, size)
+    uncached = time.perf_counter() - start
+    start = time.perf_counter()
+    for board in boards:
+        Chess_Render.render_board(board, size)
+    cached = time.perf_counter() - start
+    print("%dpx boards drawn: %.0f/s loading and scaling the images every time, %.0f/s cached" % (
+        size, count / uncached, count / cached))
+    rng = random.Random(seed)
+    archive = io.StringIO()
+    for _ in range(games):
+        gs = Chess_Engine.GameState()
+        for _ in range(max_plies):
+            moves = gs.get_valid_moves()
+            if not moves:
+                break
+            gs.make_move(rng.choice(moves))
+        Chess_PGN.write_game(archive, gs)
+    print("%8s %12s" % ("workers", "thumbnails/s"))
+    for workers in worker_counts:
+        archive.seek(0)
+        with tempfile.TemporaryDirectory() as out_dir:
+            start = time.perf_counter()
+            results = list(Chess_Render.export(Chess_PGN.read_games(archive), out_dir=out_dir, workers=workers))
+            seconds = time.perf_counter() - start
+            if len(results) != games or any(result.error is not None or not os.path.exists(result.paths[0])
+                                            for result in results):
+                raise AssertionError("Thumbnails missing for %d workers" % workers)
+        print("%8d %12.1f" % (workers, games / seconds))
+
+
+def bench_assets(frames=200, font_name="comicsansms"):
+    """Startup and frame times of the pieces and game over text of Chess_Main drawn the way it used to,
+    loading and scaling twelve files and creating a SysFont every frame, against Chess_Assets"""
+    Chess_Render.init()
+    p.font.init()
+    size = 64
+    board = Chess_Engine.GameState().board
+    screen = p.Surface((size * 8, size * 8)).convert()
+    text = "Checkmate..... White wins ....."
+
+    def draw_frame(images, render_text):
+        screen.fill(p.Color("white"))
+        for row in range(8):
+            for col in range(8):
+                if board[row][col] != "--":
+                    screen.blit(images[board[row][col]], (col * size, row * size))
+        screen.blit(render_text(), (0, 0))
+
+    start = time.perf_counter()
+    files = {piece: p.transform.scale(p.image.load(Chess_Assets.image_path(piece)), (size, size))
+             for piece in Chess_Assets.PIECES}
+    files_startup = time.perf_counter() - start
+    Chess_Assets.clear()
+    start = time.perf_counter()
+    atlas = Chess_Assets.piece_images(size)
+    atlas_startup = time.perf_counter() - start
+    start = time.perf_counter()
+    Chess_Assets.piece_images(size + 11)
+    resized = time.perf_counter() - start
+    start = time.perf_counter()
+    Chess_Assets.piece_images(size)
+    resized_back = time.perf_counter() - start
+    print("startup: %.2fms twelve files, %.2fms atlas; resize %.2fms to a new size, %.4fms back to a cached one" % (
+        files_startup * 1e3, atlas_startup * 1e3, resized * 1e3, resized_back * 1e3))
+    start = time.perf_counter()
+    for _ in range(frames):
+        draw_frame(files, lambda: p.font.SysFont(font_name, 32, True, False).render(text, 0, p.Color("Black")))
+    before = (time.perf_counter() - start) / frames
+    start = time.perf_counter()
+    for _ in range(frames):
+        draw_frame(atlas, lambda: Chess_Assets.text(text, font_name, 32, "Black", True))
+    after = (time.perf_counter() - start) / frames
+    print("frame with the game over text: %.3fms before, %.3fms with the asset caches" % (before * 1e3, after * 1e3))
+
+
+def bench_background(search_seconds=1.0, frame_seconds=1 / 60, position="italian"):
+    """Longest frame of a 60 frames a second loop that needs the legal moves and an engine move for a
+    position, worked out inline on the loop against asked of Chess_Background's worker process and
+    polled for, and how long the worker takes to send back the legal moves"""
+    gs = Chess_Benchmark.play_moves(Chess_Engine.GameState(), Chess_Benchmark.POSITIONS[position])
+    move_IDs = [move.move_ID for move in gs.movelog]
+    start = time.perf_counter()
+    gs.get_valid_moves()
+    Chess_Search.Searcher().search(gs, time_limit=search_seconds)
+    print("inline: one frame of %.0fms while the engine thinks" % ((time.perf_counter() - start) * 1e3))
+    worker = Chess_Background.BackgroundWorker()
+    try:
+        start_fen = Chess_Engine.START_FEN
+        round_trips = []
+        for _ in range(20):
+            start = time.perf_counter()
+            worker.request_moves(start_fen, move_IDs)
+            while not worker.poll():
+                time.sleep(0.0005)
+            round_trips.append(time.perf_counter() - start)
+        worker.request_moves(start_fen, move_IDs)
+        worker.request_search(start_fen, move_IDs, search_seconds)
+        frames = []
+        replies = []
+        while len(replies) < 2:
+            frame_start = time.perf_counter()
+            replies += worker.poll()
+            frames.append(time.perf_counter() - frame_start)
+            time.sleep(max(frame_seconds - frames[-1], 0))
+        worker.request_search(start_fen, move_IDs, 30)
+        time.sleep(0.2)
+        start = time.perf_counter()
+        worker.new_generation() #cancel the search and wait for the worker to be free again
+        worker.request_moves(start_fen, move_IDs)
+        while not worker.poll():
+            time.sleep(0.0005)
+        cancelled = time.perf_counter() - start
+    finally:
+        worker.close()
+    print("worker: legal moves back in %.2fms median, %d frames while the engine thinks, longest %.3fms, "
+          "a 30s search cancelled in %.0fms" % (sorted(round_trips)[len(round_trips) // 2] * 1e3, len(frames),
+                                               max(frames) * 1e3, cancelled * 1e3))
+
+
+if __name__ == "__main__":
+    bench_render()
+    print()
+    bench_assets()
+    print()
+    bench_background()